@@ -102,18 +102,23 @@ def main():
             print(f"Error: {result['error']}")
             return 1
         
-        print("\n" + "="*80)
-        print("ANSWER:")
-        print("="*80)
-        print(result["answer"])
-        print("\n" + "="*80)
-        print(f"SOURCES ({result['num_sources']}):")
-        print("="*80)
+        # Build the report first and write it in one call so it is not
+        # interleaved with log output
+        lines = [
+            "\n" + "="*80,
+            "ANSWER:",
+            "="*80,
+            result["answer"],
+            "\n" + "="*80,
+            f"SOURCES ({result['num_sources']}):",
+            "="*80
+        ]
         for i, source in enumerate(result["sources"], 1):
-            print(f"\n[{i}] {source.get('file_name', 'Unknown')}")
+            lines.append(f"\n[{i}] {source.get('file_name', 'Unknown')}")
             if source.get("page_number"):
-                print(f"    Page: {source['page_number']}")
-            print(f"    Text: {source['text']}...")
+                lines.append(f"    Page: {source['page_number']}")
+            lines.append(f"    Text: {source['text']}...")
+        sys.stdout.write("\n".join(lines) + "\n")
         
         return 0
 
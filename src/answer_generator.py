@@ -2,11 +2,49 @@
 Answer Generation Module
 Generates final answers based on retrieved documents using an LLM.
 """
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
+from functools import lru_cache
 import logging
+import re
 import requests
 import os
+import orjson
 from . import config
+from .chunker import get_tokenizer
+from .http_session import create_session
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+_NO_INFO_ANSWER = "I couldn't find any relevant information to answer your question."
+
+# Smallest trailing fragment (in tokens) worth adding when a document is cut off
+_MIN_PARTIAL_TOKENS = 25
+
+# Model families that take max_completion_tokens instead of max_tokens
+_MAX_COMPLETION_MODELS = re.compile(r"gpt-4o|gpt-5|o1")
+# Model families that only accept the default temperature (1)
+_FIXED_TEMPERATURE_MODELS = re.compile(r"o1|gpt-4o-mini")
+
+
+@lru_cache(maxsize=32)
+def _model_caps(model: str) -> Tuple[bool, bool]:
+    """
+    Resolve request options for a model name.
+    
+    Args:
+        model: LLM model name
+        
+    Returns:
+        (use_max_completion_tokens, supports_custom_temperature)
+    """
+    model_lower = model.lower()
+    use_max_completion_tokens = _MAX_COMPLETION_MODELS.search(model_lower) is not None
+    supports_custom_temperature = not (
+        _FIXED_TEMPERATURE_MODELS.search(model_lower) or
+        ("gpt-4o" in model_lower and "2024" in model_lower)
+    )
+    return use_max_completion_tokens, supports_custom_temperature
 
 
 class AnswerGenerator:
@@ -22,12 +60,17 @@ class AnswerGenerator:
         self.llm_api_url = llm_api_url or config.LLM_API_URL
         self.llm_api_key = config.LLM_API_KEY
         self.model = config.LLM_MODEL
+        # Anthropic uses "x-api-key"; OpenAI and generic APIs use "Authorization: Bearer <key>"
+        self._auth_style = "anthropic" if self.llm_api_url and "anthropic.com" in self.llm_api_url else "bearer"
+        # Pooled session so repeated answers reuse the TLS connection
+        self._session = create_session()
     
     def generate_answer(
         self,
         query: str,
         retrieved_docs: List[Dict],
-        max_context_length: int = 2000
+        max_context_length: int = 500,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> str:
         """
         Generate answer based on query and retrieved documents.
@@ -35,24 +78,55 @@ class AnswerGenerator:
         Args:
             query: User query
             retrieved_docs: List of retrieved document chunks
-            max_context_length: Maximum characters of context to include
+            max_context_length: Maximum tokens of context to include
+            on_token: Optional callback; when given, the LLM response is streamed
+                and each text fragment is passed to it as it arrives. Answers
+                not produced by the LLM are passed in a single call.
             
         Returns:
             Generated answer text
         """
         if not retrieved_docs:
-            return "I couldn't find any relevant information to answer your question."
+            return self._emit(_NO_INFO_ANSWER, on_token)
         
         # Build context from retrieved documents
         context = self._build_context(retrieved_docs, max_context_length)
+        return self._answer_from_context(query, context, retrieved_docs, on_token)[0]
+    
+    def _answer_from_context(
+        self,
+        query: str,
+        context: str,
+        retrieved_docs: List[Dict],
+        on_token: Optional[Callable[[str], None]]
+    ) -> Tuple[str, bool]:
+        """
+        Generate an answer from an already built context.
         
+        Args:
+            query: User query
+            context: Context from retrieved documents
+            retrieved_docs: Retrieved document chunks the context was built from
+            on_token: Optional streaming callback (see generate_answer)
+            
+        Returns:
+            Tuple of (answer text, True if the LLM failed and a fallback answer
+            was produced instead)
+        """
         # Generate answer using LLM (only if API URL and API key are provided)
         if self.llm_api_url and self.llm_api_key:
-            return self._generate_with_api(query, context)
+            return self._generate_with_api(query, context, on_token)
         else:
             if self.llm_api_url and not self.llm_api_key:
-                logging.getLogger(__name__).warning("LLM_API_URL is set but LLM_API_KEY is missing. Using simple answer generator.")
-            return self._generate_simple_answer(query, context, retrieved_docs)
+                logger.warning("LLM_API_URL is set but LLM_API_KEY is missing. Using simple answer generator.")
+            return self._emit(self._generate_simple_answer(query, context, retrieved_docs), on_token), False
+    
+    @staticmethod
+    def _emit(answer: str, on_token: Optional[Callable[[str], None]]) -> str:
+        """Pass a complete answer to the streaming callback, if any, and return it."""
+        if on_token:
+            on_token(answer)
+        return answer
     
     def _build_context(self, docs: List[Dict], max_length: int) -> str:
         """
@@ -60,61 +134,91 @@ class AnswerGenerator:
         
         Args:
             docs: List of document dictionaries
-            max_length: Maximum context length
+            max_length: Maximum context length in tokens
             
         Returns:
             Context string
         """
+        return self._build_context_and_sources(docs, max_length)[0]
+    
+    def _build_context_and_sources(self, docs: List[Dict], max_length: int) -> Tuple[str, List[Dict]]:
+        """
+        Build the context string and source citations in a single pass.
+        
+        The context budget is counted in tokens, matching how the LLM limits
+        context, and each document is encoded only once. Every document gets a
+        source entry, including those past the context budget.
+        
+        Args:
+            docs: List of document dictionaries
+            max_length: Maximum context length in tokens
+            
+        Returns:
+            (context string, list of source dictionaries)
+        """
+        encoding = get_tokenizer()
         context_parts = []
-        current_length = 0
+        sources = []
+        tokens_used = 0
+        context_full = False
         
         for doc in docs:
             doc_text = doc.get("text", "")
-            doc_length = len(doc_text)
+            metadata = doc.get("metadata", {})
+            sources.append({
+                "text": doc_text[:200],  # First 200 chars
+                "file_name": metadata.get("file_name", "Unknown"),
+                "page_number": metadata.get("page_number", None),
+                "chunk_id": doc.get("chunk_id", None)
+            })
             
-            if current_length + doc_length > max_length:
+            if context_full:
+                continue
+            
+            token_ids = encoding.encode_ordinary(doc_text)
+            if tokens_used + len(token_ids) > max_length:
                 # Add partial document if there's room
-                remaining = max_length - current_length
-                if remaining > 100:  # Only add if there's meaningful space
-                    context_parts.append(doc_text[:remaining])
-                break
+                remaining = max_length - tokens_used
+                if remaining >= _MIN_PARTIAL_TOKENS:  # Only add if there's meaningful space
+                    context_parts.append(encoding.decode(token_ids[:remaining]))
+                context_full = True
+                continue
             
             context_parts.append(doc_text)
-            current_length += doc_length
+            tokens_used += len(token_ids)
         
-        return "\n\n".join(context_parts)
+        return "\n\n".join(context_parts), sources
     
-    def _generate_with_api(self, query: str, context: str) -> str:
+    def _generate_with_api(
+        self,
+        query: str,
+        context: str,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, bool]:
         """
         Generate answer using LLM API.
         
         Args:
             query: User query
             context: Context from retrieved documents
+            on_token: Optional callback that enables streaming (see generate_answer)
             
         Returns:
-            Generated answer
+            Tuple of (generated answer, True if the API failed and the answer is
+            a fallback)
         """
+        # Fragments already handed to on_token, so a failure mid-stream does not
+        # emit the fallback answer on top of partial output
+        streamed: List[str] = []
         try:
             # Build prompt
             prompt = self._build_prompt(query, context)
             
             # Call LLM API
-            # Determine if model uses max_tokens or max_completion_tokens
-            use_max_completion_tokens = (
-                "gpt-4o" in self.model.lower() or 
-                "gpt-5" in self.model.lower() or
-                "o1" in self.model.lower()
-            )
-            
-            # Some models only support default temperature (1)
-            # Models like o1, gpt-4o-mini, and some newer models have temperature restrictions
-            model_lower = self.model.lower()
-            supports_custom_temperature = not (
-                "o1" in model_lower or
-                "gpt-4o-mini" in model_lower or
-                ("gpt-4o" in model_lower and "2024" in self.model)
-            )
+            # Determine if model uses max_tokens or max_completion_tokens, and
+            # whether it accepts a custom temperature (o1, gpt-4o-mini and some
+            # newer models only support the default of 1)
+            use_max_completion_tokens, supports_custom_temperature = _model_caps(self.model)
             
             payload = {
                 "model": self.model,
@@ -147,35 +251,34 @@ class AnswerGenerator:
             else:
                 payload["max_tokens"] = 500
             
+            if on_token:
+                payload["stream"] = True
+            
             headers = {
                 "Content-Type": "application/json"
             }
             
             # Add API key authentication if provided
             if self.llm_api_key:
-                # OpenAI uses "Authorization: Bearer <key>"
-                if "openai.com" in self.llm_api_url or "api.openai" in self.llm_api_url:
-                    headers["Authorization"] = f"Bearer {self.llm_api_key}"
-                # Anthropic uses "x-api-key" header
-                elif "anthropic.com" in self.llm_api_url:
+                if self._auth_style == "anthropic":
                     headers["x-api-key"] = self.llm_api_key
                     headers["anthropic-version"] = "2023-06-01"
-                # Generic API key header
                 else:
                     headers["Authorization"] = f"Bearer {self.llm_api_key}"
             
             # Try with initial payload
-            response = requests.post(
+            response = self._session.post(
                 self.llm_api_url,
-                json=payload,
+                data=orjson.dumps(payload),
                 headers=headers,
-                timeout=60
+                timeout=60,
+                stream=bool(on_token)
             )
             
             # If we get a temperature error, retry with temperature=1
             if response.status_code == 400:
                 try:
-                    error_data = response.json()
+                    error_data = orjson.loads(response.content)
                     if "error" in error_data:
                         error_msg = error_data["error"].get("message", "")
                         error_param = error_data["error"].get("param", "")
@@ -183,58 +286,112 @@ class AnswerGenerator:
                         if "temperature" in error_msg.lower() or error_param == "temperature":
                             # Retry with temperature=1 (default)
                             payload["temperature"] = 1
-                            response = requests.post(
+                            response = self._session.post(
                                 self.llm_api_url,
-                                json=payload,
+                                data=orjson.dumps(payload),
                                 headers=headers,
-                                timeout=60
+                                timeout=60,
+                                stream=bool(on_token)
                             )
                 except (ValueError, KeyError):
                     pass  # If we can't parse the error, continue with original response
             
             # Log error details if request fails
             if response.status_code != 200:
-                logger = logging.getLogger(__name__)
                 logger.error("LLM API Error: %s", response.status_code)
                 logger.error("Response: %s", response.text[:500])
             
             response.raise_for_status()
             
-            result = response.json()
+            if on_token:
+                return self._read_stream(response, on_token, streamed), False
             
-            # Debug: Log the response structure
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.debug(f"LLM API Response keys: {list(result.keys())}")
-            if "choices" in result and result["choices"]:
-                logger.debug(f"First choice keys: {list(result['choices'][0].keys())}")
+            result = orjson.loads(response.content)
+            
+            # Debug: Log the response structure (only built when DEBUG is on)
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug(f"LLM API Response keys: {list(result.keys())}")
+                if "choices" in result and result["choices"]:
+                    logger.debug(f"First choice keys: {list(result['choices'][0].keys())}")
             
             # Handle different response formats
             if "choices" in result and result["choices"]:
                 message = result["choices"][0].get("message", {})
-                logger.debug(f"Message type: {type(message)}, keys: {list(message.keys()) if isinstance(message, dict) else 'N/A'}")
+                if debug:
+                    logger.debug(f"Message type: {type(message)}, keys: {list(message.keys()) if isinstance(message, dict) else 'N/A'}")
                 if isinstance(message, dict) and "content" in message:
                     content = message["content"]
-                    logger.debug(f"Content length: {len(content) if content else 0}")
-                    return content or ""
+                    if debug:
+                        logger.debug(f"Content length: {len(content) if content else 0}")
+                    return content or "", False
                 elif isinstance(message, str):
-                    return message
+                    return message, False
                 else:
                     logger.warning(f"Message format unexpected: {message}")
+                    return "Error: Unexpected API response format", True
             elif "content" in result:
-                return result["content"]
+                return result["content"], False
             elif "text" in result:
-                return result["text"]
+                return result["text"], False
             else:
                 logger.warning(f"Unexpected API response format. Keys: {list(result.keys())}")
-                return "Error: Unexpected API response format"
+                return "Error: Unexpected API response format", True
                 
         except requests.exceptions.RequestException as e:
-            logging.getLogger(__name__).error("Error calling LLM API: %s", e, exc_info=True)
-            return self._generate_simple_answer(query, context, [])
+            logger.error("Error calling LLM API: %s", e, exc_info=True)
+            return self._fallback_answer(query, context, on_token, streamed), True
         except Exception as e:
-            logging.getLogger(__name__).error("Error generating answer: %s", e, exc_info=True)
-            return self._generate_simple_answer(query, context, [])
+            logger.error("Error generating answer: %s", e, exc_info=True)
+            return self._fallback_answer(query, context, on_token, streamed), True
+    
+    def _fallback_answer(
+        self,
+        query: str,
+        context: str,
+        on_token: Optional[Callable[[str], None]],
+        streamed: List[str]
+    ) -> str:
+        """Return the template answer after an API failure, streaming it only if nothing was streamed yet."""
+        answer = self._generate_simple_answer(query, context, [])
+        return answer if streamed else self._emit(answer, on_token)
+    
+    def _read_stream(
+        self,
+        response: requests.Response,
+        on_token: Callable[[str], None],
+        streamed: List[str]
+    ) -> str:
+        """
+        Consume a server-sent events response, forwarding text fragments.
+        
+        Handles OpenAI-style `choices[0].delta.content` chunks and Anthropic-style
+        `delta.text` events.
+        
+        Args:
+            response: Streaming HTTP response
+            on_token: Callback receiving each text fragment
+            streamed: List the fragments are appended to
+            
+        Returns:
+            Full answer text
+        """
+        for line in response.iter_lines():
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            event = orjson.loads(data)
+            choices = event.get("choices")
+            if choices:
+                fragment = (choices[0].get("delta") or {}).get("content")
+            else:
+                fragment = (event.get("delta") or {}).get("text")
+            if fragment:
+                streamed.append(fragment)
+                on_token(fragment)
+        return "".join(streamed)
     
     def _generate_simple_answer(
         self,
@@ -292,7 +449,8 @@ Answer:"""
         self,
         query: str,
         retrieved_docs: List[Dict],
-        max_context_length: int = 2000
+        max_context_length: int = 500,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> Dict:
         """
         Generate answer with source citations.
@@ -300,28 +458,24 @@ Answer:"""
         Args:
             query: User query
             retrieved_docs: List of retrieved document chunks
-            max_context_length: Maximum context length
+            max_context_length: Maximum tokens of context to include
+            on_token: Optional streaming callback (see generate_answer)
             
         Returns:
-            Dictionary with answer and sources
+            Dictionary with answer and sources; "fallback" is True when the
+            answer was not produced normally (no documents, or the LLM failed)
         """
-        answer = self.generate_answer(query, retrieved_docs, max_context_length)
+        if not retrieved_docs:
+            answer = self._emit(_NO_INFO_ANSWER, on_token)
+            return {"answer": answer, "sources": [], "num_sources": 0, "fallback": True}
         
-        # Extract source information
-        sources = []
-        for doc in retrieved_docs:
-            metadata = doc.get("metadata", {})
-            source = {
-                "text": doc.get("text", "")[:200],  # First 200 chars
-                "file_name": metadata.get("file_name", "Unknown"),
-                "page_number": metadata.get("page_number", None),
-                "chunk_id": doc.get("chunk_id", None)
-            }
-            sources.append(source)
+        context, sources = self._build_context_and_sources(retrieved_docs, max_context_length)
+        answer, fallback = self._answer_from_context(query, context, retrieved_docs, on_token)
         
         return {
             "answer": answer,
             "sources": sources,
-            "num_sources": len(sources)
+            "num_sources": len(sources),
+            "fallback": fallback
         }
 
@@ -2,8 +2,12 @@
 Content Chunking Module
 Splits text into retrievable chunks using LangChain's RecursiveCharacterTextSplitter with tiktoken.
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
+import functools
+import hashlib
 import logging
+import os
+import orjson
 import tiktoken
 try:
     from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -24,6 +28,20 @@ from . import config
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=8)
+def get_tokenizer(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """
+    Return the tiktoken encoding for a name, loading it only once.
+    
+    Args:
+        encoding_name: The encoding to use (default: cl100k_base for GPT models)
+        
+    Returns:
+        Cached tiktoken Encoding object
+    """
+    return tiktoken.get_encoding(encoding_name)
+
+
 def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> int:
     """
     Count the number of tokens in a string using tiktoken.
@@ -35,15 +53,19 @@ def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> i
     Returns:
         Number of tokens
     """
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+    return len(get_tokenizer(encoding_name).encode(string))
 
 
 class TextChunker:
     """Split text into chunks for retrieval using RecursiveCharacterTextSplitter with token counting."""
     
-    def __init__(self, chunk_size: int = None, chunk_overlap: int = None, encoding_name: str = "cl100k_base"):
+    def __init__(
+        self,
+        chunk_size: int = None,
+        chunk_overlap: int = None,
+        encoding_name: str = "cl100k_base",
+        cache_dir: str = None
+    ):
         """
         Initialize chunker.
         
@@ -51,19 +73,76 @@ class TextChunker:
             chunk_size: Size of each chunk in tokens (default from config)
             chunk_overlap: Overlap between chunks in tokens (default from config)
             encoding_name: Token encoding to use (default: cl100k_base)
+            cache_dir: Directory for cached split results (default from config;
+                an empty value disables caching)
         """
         self.chunk_size = chunk_size or config.CHUNK_SIZE
         self.chunk_overlap = chunk_overlap or config.CHUNK_OVERLAP
         self.encoding_name = encoding_name
-        
-        # Initialize RecursiveCharacterTextSplitter with token counting
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        self.cache_dir = config.CHUNK_CACHE_DIR if cache_dir is None else cache_dir
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self._encoding = get_tokenizer(encoding_name)
+        
+        # Initialize RecursiveCharacterTextSplitter with LangChain's built-in tiktoken length function
+        self.text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=encoding_name,
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
-            length_function=num_tokens_from_string,
             separators=["\n\n", "\n", ". ", " ", ""]  # Default separators
         )
     
+    def _count_tokens_batch(self, strs: List[str]) -> List[int]:
+        """
+        Count tokens for many strings at once.
+        
+        tiktoken encodes the batch on a native thread pool, which is much
+        faster than calling encode() per string from Python.
+        
+        Args:
+            strs: Strings to count tokens for
+            
+        Returns:
+            Token count per string, in input order
+        """
+        encoded = self._encoding.encode_ordinary_batch(strs, num_threads=os.cpu_count() or 1)
+        return [len(tokens) for tokens in encoded]
+    
+    def _cache_path(self, page_texts: List[str]) -> str:
+        """
+        Return the cache file for the combined page texts under the current split settings.
+        
+        Pages are hashed one at a time, as if joined with the same separator as
+        the combined text, so no encoded copy of the whole document is built.
+        """
+        digest = hashlib.sha256(f"{self.chunk_size}:{self.chunk_overlap}:{self.encoding_name}\n".encode("utf-8"))
+        for i, page_text in enumerate(page_texts):
+            if i:
+                digest.update(b"\n\n")
+            digest.update(page_text.encode("utf-8"))
+        return os.path.join(self.cache_dir, f"{digest.hexdigest()}.json")
+    
+    def _load_cached_split(self, cache_path: str) -> Optional[List[str]]:
+        """Return cached chunk texts, or None on a miss or unreadable entry."""
+        try:
+            with open(cache_path, "rb") as f:
+                return orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, orjson.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable chunk cache entry {cache_path}: {e}")
+            return None
+    
+    def _store_cached_split(self, cache_path: str, texts: List[str]):
+        """Write chunk texts to the cache, replacing the file atomically."""
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(texts))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write chunk cache entry {cache_path}: {e}")
+    
     def chunk_documents(self, pages: List[Document]) -> List[Dict]:
         """
         Split documents (pages) into chunks using RecursiveCharacterTextSplitter.
@@ -85,51 +164,61 @@ class TextChunker:
         logger.info(f"Starting chunking: {len(pages)} pages")
         logger.info(f"Chunk size: {self.chunk_size} tokens, Overlap: {self.chunk_overlap} tokens")
         
+        # Token statistics only feed the logs, so skip tokenizing when INFO is off
+        log_stats = logger.isEnabledFor(logging.INFO)
+        
+        # Collect the page texts once; token stats, the cache key and the
+        # combined text all read from this list
+        page_texts = [page.page_content for page in pages]
+        
         # Calculate total tokens before chunking
-        total_tokens = sum(num_tokens_from_string(page.page_content) for page in pages)
-        logger.info(f"Total tokens in pages: {total_tokens}")
+        if log_stats:
+            total_tokens = sum(self._count_tokens_batch(page_texts))
+            logger.info(f"Total tokens in pages: {total_tokens}")
         
         # Combine all pages into one document for chunking
         # This ensures chunks respect CHUNK_SIZE across page boundaries
-        combined_text = "\n\n".join([page.page_content for page in pages])
+        combined_text = "\n\n".join(page_texts)
         
         # Get metadata from first page (for file-level metadata)
         combined_metadata = pages[0].metadata.copy() if pages[0].metadata else {}
         
-        # Create a single combined document
-        combined_doc = Document(
-            page_content=combined_text,
-            metadata=combined_metadata
-        )
+        # Re-ingesting an unchanged document reuses the previous split. Only the
+        # chunk texts are cached; metadata always comes from the current pages.
+        cache_path = self._cache_path(page_texts) if self.cache_dir else None
+        split_texts = self._load_cached_split(cache_path) if cache_path else None
         
-        # Split the combined document using chunk_size
-        split_docs = self.text_splitter.split_documents([combined_doc])
+        if split_texts is not None:
+            logger.info(f"Chunk cache hit: reusing {len(split_texts)} chunks")
+        else:
+            # Split the combined text using chunk_size
+            split_texts = self.text_splitter.split_text(combined_text)
+            if cache_path:
+                self._store_cached_split(cache_path, split_texts)
         
-        logger.info(f"Created {len(split_docs)} chunks from {len(pages)} pages (combined)")
+        logger.info(f"Created {len(split_texts)} chunks from {len(pages)} pages (combined)")
         
         # Convert to the expected format
         chunks = []
-        chunk_token_stats = []
-        for chunk_id, split_doc in enumerate(split_docs):
-            chunk_metadata = split_doc.metadata.copy() if split_doc.metadata else {}
+        for chunk_id, split_text in enumerate(split_texts):
+            chunk_metadata = combined_metadata.copy()
             chunk_metadata["chunk_id"] = chunk_id
             
-            chunk_text = split_doc.page_content.strip()
-            chunk_tokens = num_tokens_from_string(chunk_text)
-            chunk_token_stats.append(chunk_tokens)
-            
             chunks.append({
-                "text": chunk_text,
+                "text": split_text.strip(),
                 "chunk_id": chunk_id,
                 "metadata": chunk_metadata
             })
+        
+        # Log chunk statistics (re-tokenizes every chunk)
+        if chunks and log_stats:
+            chunk_token_stats = self._count_tokens_batch([chunk["text"] for chunk in chunks])
             
             # Log first few chunks for debugging
-            if chunk_id < 3:
-                logger.debug(f"Chunk {chunk_id}: {chunk_tokens} tokens, {len(chunk_text)} chars")
-        
-        # Log chunk statistics
-        if chunk_token_stats:
+            if logger.isEnabledFor(logging.DEBUG):
+                for chunk, chunk_tokens in zip(chunks[:3], chunk_token_stats):
+                    logger.debug(f"Chunk {chunk['chunk_id']}: {chunk_tokens} tokens, {len(chunk['text'])} chars")
+            
             avg_tokens = sum(chunk_token_stats) / len(chunk_token_stats)
             min_tokens = min(chunk_token_stats)
             max_tokens = max(chunk_token_stats)
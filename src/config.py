@@ -2,6 +2,7 @@
 Configuration file for the RAG system.
 """
 import os
+from collections import namedtuple
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -14,28 +15,102 @@ ELASTICSEARCH_PASSWORD = os.getenv("ELASTICSEARCH_PASSWORD", "")
 ELASTICSEARCH_API_KEY = os.getenv("ELASTICSEARCH_API_KEY", "")
 ELASTICSEARCH_VERIFY_CERTS = os.getenv("ELASTICSEARCH_VERIFY_CERTS", "false").lower() == "true"
 ELASTICSEARCH_INDEX_NAME = os.getenv("ELASTICSEARCH_INDEX_NAME", "pdf_rag_index")
+ES_BULK_CHUNK_SIZE = 500  # Documents per bulk request
+ES_BULK_THREADS = 4  # Parallel bulk worker threads
+# Pooled connections per Elasticsearch node; bulk threads, concurrent ingestion
+# and query threads all share the one client
+ES_CONNECTIONS_PER_NODE = 32
 
 # Embedding Configuration
 EMBEDDING_URL = os.getenv("EMBEDDING_URL", "")
 EMBEDDING_MODEL = "qwen3-embedding-0.6b"
 EMBEDDING_DIMENSION = 1024  # Dimension for qwen3-embedding-0.6b
+# Request field the embedding API expects ("texts" or "input"); empty probes on first call
+EMBEDDING_PAYLOAD_FORMAT = os.getenv("EMBEDDING_PAYLOAD_FORMAT", "")
+# Store vectors in Elasticsearch as int8 (element_type "byte") instead of float32;
+# changing this requires re-creating the index
+EMBEDDING_QUANTIZE_INT8 = os.getenv("EMBEDDING_QUANTIZE_INT8", "false").lower() == "true"
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))  # Embedding API requests in flight at once
+# Cap on embedding API requests in flight across all threads (concurrent PDFs,
+# prefetched batches and concurrent batches all share it)
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "8"))
+EMBED_GZIP = os.getenv("EMBED_GZIP", "false").lower() == "true"  # gzip request bodies sent to the embedding API
+GZIP_MIN_BYTES = 4096  # Request bodies smaller than this are sent uncompressed
+EMBED_FALLBACK_WORKERS = 4  # Concurrent single-text requests when the batch format is rejected
+# Window for merging concurrent query embeddings into one API call (0 disables)
+EMBED_COALESCE_MS = float(os.getenv("EMBED_COALESCE_MS", "0"))
+EMBED_COALESCE_MAX = 32  # Most queries merged into one coalesced request
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", ".cache/embeddings")  # Empty disables the on-disk cache
+EMBED_MEMORY_CACHE_SIZE = 10000  # Embeddings kept in memory in front of the on-disk cache (0 disables)
 
 # Re-ranking Configuration
 RERANK_URL = os.getenv("RERANK_URL", "")
 RERANK_MODEL = "qwen3-reranker-0.6b"
 RERANK_TOP_K = 10  # Number of results to re-rank
+RERANK_GZIP = os.getenv("RERANK_GZIP", "false").lower() == "true"  # gzip request bodies sent to the re-ranker API
+RERANK_CACHE_SIZE = 4096  # Re-ranker API responses kept for repeated queries (0 disables)
+RERANK_CACHE_TTL = 20  # Seconds a cached re-ranker response stays valid
 
 # Chunking Configuration
 CHUNK_SIZE = 500  # Tokens per chunk (using tiktoken)
 CHUNK_OVERLAP = 50  # Overlap between chunks in tokens
+CHUNK_CACHE_DIR = os.getenv("CHUNK_CACHE_DIR", ".cache/chunks")  # Empty disables the on-disk cache
+
+# Ingestion Configuration
+INGEST_CONCURRENCY = 4  # Number of PDFs processed in parallel by process_documents
+EMBED_BATCH_SIZE = 100  # Chunks embedded and then indexed together per pipeline step
+EMBED_PREFETCH = 2  # Batches embedded ahead of the batch being indexed
 
 # Retrieval Configuration
 RETRIEVAL_TOP_K = 10  # Number of documents to retrieve before re-ranking
 BM25_WEIGHT = 0.3  # Weight for BM25 score in hybrid search
 VECTOR_WEIGHT = 0.7  # Weight for vector score in hybrid search
+# How hybrid search fuses BM25 and vector hits: "weighted" (BM25_WEIGHT/VECTOR_WEIGHT
+# score sum) or "rrf" (Elasticsearch's native Reciprocal Rank Fusion)
+RETRIEVAL_FUSION = os.getenv("RETRIEVAL_FUSION", "weighted").lower()
+RRF_RANK_CONSTANT = 60  # RRF k: score = sum(1 / (k + rank))
+RRF_WINDOW_SIZE = 100  # Hits per sub-search considered by RRF
+
+# Query Cache Configuration
+QUERY_CACHE_SIZE = 128  # Answers kept for repeated identical queries (0 disables)
+SEMANTIC_CACHE_SIZE = 256  # Answers kept for paraphrased queries (0 disables)
+SEMANTIC_CACHE_THRESHOLD = 0.95  # Minimum cosine similarity to reuse a cached answer
 
 # LLM Configuration (for answer generation)
 LLM_API_URL = os.getenv("LLM_API_URL", "")  # Optional: set if you have an LLM API
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")  # API key for LLM (e.g., OpenAI API key)
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-5-nano")  # Model name for answer generation
 
+# Pipeline settings snapshot, bound once per RAGPipeline instead of looked up per call
+PipelineSettings = namedtuple("PipelineSettings", [
+    "retrieval_top_k",
+    "rerank_top_k",
+    "bm25_weight",
+    "vector_weight",
+    "chunk_size",
+    "chunk_overlap",
+    "ingest_concurrency",
+    "embed_batch_size",
+    "embed_prefetch",
+    "query_cache_size",
+    "semantic_cache_size",
+    "semantic_cache_threshold",
+])
+
+
+def pipeline_settings() -> PipelineSettings:
+    """Return the current pipeline settings as an immutable snapshot."""
+    return PipelineSettings(
+        retrieval_top_k=RETRIEVAL_TOP_K,
+        rerank_top_k=RERANK_TOP_K,
+        bm25_weight=BM25_WEIGHT,
+        vector_weight=VECTOR_WEIGHT,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        ingest_concurrency=INGEST_CONCURRENCY,
+        embed_batch_size=EMBED_BATCH_SIZE,
+        embed_prefetch=EMBED_PREFETCH,
+        query_cache_size=QUERY_CACHE_SIZE,
+        semantic_cache_size=SEMANTIC_CACHE_SIZE,
+        semantic_cache_threshold=SEMANTIC_CACHE_THRESHOLD,
+    )
@@ -2,45 +2,511 @@
 Embedding Module
 Provides local embedding function for vectorization.
 """
-from typing import List
+from typing import Dict, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import repeat
+import gzip
 import logging
+import queue
+import threading
+import time
+import numpy as np
+import orjson
 import requests
 from . import config
+from .embedding_cache import EmbeddingCache
+from .http_session import create_session
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Shared pooled session; keeps connections to the embedding API alive between
+# batches. Sized to the request cap so every in-flight request gets a pooled
+# connection instead of opening and discarding extras.
+# Transient failures (429/5xx, timeouts) are retried with jittered exponential
+# backoff before EmbeddingAPIError is raised.
+_SESSION = create_session(
+    pool_connections=4,
+    pool_maxsize=config.EMBED_MAX_IN_FLIGHT,
+    retries=5,
+    backoff_factor=2,
+    status_forcelist=(429, 500, 502, 503, 504, 529),
+    backoff_jitter=1.0
+)
+_SESSION.headers["Connection"] = "keep-alive"
 
-def local_embedding(texts: List[str], batch_size: int = 10) -> List[List[float]]:
+# Process-wide limit on concurrent embedding requests, so parallel ingestion
+# cannot exceed the provider's rate limits
+_REQUEST_SLOTS = threading.BoundedSemaphore(config.EMBED_MAX_IN_FLIGHT)
+
+# Request field ("texts" or "input") the API accepts for batch requests. Seeded
+# from config.EMBEDDING_PAYLOAD_FORMAT, otherwise learned from the first success.
+_WORKING_FORMAT: Optional[str] = config.EMBEDDING_PAYLOAD_FORMAT or None
+_WORKING_LOCK = threading.Lock()
+
+# Persistent embedding cache, opened on first use
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+class EmbeddingAPIError(Exception):
+    """Raised when the embedding API cannot produce embeddings for a batch."""
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into batched API calls.
+    
+    Callers block in embed() while a background thread collects requests for
+    up to max_wait_ms (or until max_batch are queued) and embeds them with one
+    local_embedding call.
+    """
+    
+    def __init__(self, max_batch: int = None, max_wait_ms: float = None):
+        """
+        Initialize the batcher and start its worker thread.
+        
+        Args:
+            max_batch: Most texts merged into one request (default from config)
+            max_wait_ms: How long to wait for more texts after the first (default from config)
+        """
+        self.max_batch = max_batch or config.EMBED_COALESCE_MAX
+        self.max_wait = (config.EMBED_COALESCE_MS if max_wait_ms is None else max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+    
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Embed one text as part of the next coalesced batch.
+        
+        Args:
+            text: Text to embed
+            
+        Returns:
+            float32 vector of shape (dim,)
+            
+        Raises:
+            EmbeddingAPIError: If the batch could not be embedded
+        """
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+    
+    def _run(self):
+        """Worker loop: collect a batch, embed it, resolve each caller's future."""
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            texts = [text for text, _ in pending]
+            try:
+                embeddings = local_embedding(texts, batch_size=self.max_batch)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            if len(pending) > 1:
+                logger.debug(f"Coalesced {len(pending)} query embeddings into one request")
+            for row, (_, future) in enumerate(pending):
+                future.set_result(embeddings[row])
+
+
+# Query batcher, started on first use when config.EMBED_COALESCE_MS is set
+_BATCHER = None
+_BATCHER_LOCK = threading.Lock()
+
+
+def _get_batcher() -> QueryBatcher:
+    """Return the shared query batcher, starting it on first use."""
+    global _BATCHER
+    if _BATCHER is None:
+        with _BATCHER_LOCK:
+            if _BATCHER is None:
+                _BATCHER = QueryBatcher()
+    return _BATCHER
+
+
+def _get_cache() -> EmbeddingCache:
+    """Return the shared on-disk embedding cache, opening it on first use."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = EmbeddingCache()
+    return _CACHE
+
+
+def _post_json(payload: Dict) -> requests.Response:
+    """
+    POST a JSON payload to the embedding API.
+    
+    At most config.EMBED_MAX_IN_FLIGHT requests run at once process-wide.
+    With config.EMBED_GZIP, bodies of at least config.GZIP_MIN_BYTES are
+    gzip-compressed (level 1: text and float arrays shrink several-fold for
+    little CPU). Compressed responses are requested by default and decoded
+    transparently.
+    
+    Args:
+        payload: Request payload
+        
+    Returns:
+        HTTP response
+    """
+    body = orjson.dumps(payload)
+    headers = {"Content-Type": "application/json"}
+    if config.EMBED_GZIP and len(body) >= config.GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    with _REQUEST_SLOTS:
+        return _SESSION.post(config.EMBEDDING_URL, data=body, headers=headers, timeout=30)
+
+
+def normalize_embeddings(embeddings) -> np.ndarray:
+    """
+    L2-normalize one embedding or a matrix of embeddings (one per row).
+    
+    A writable float32 array is normalized in place; anything else (lists,
+    other dtypes, read-only cache views) is converted to a new float32 array
+    first. All-zero rows stay zero.
+    
+    Args:
+        embeddings: Vector of shape (dim,) or matrix of shape (n, dim)
+        
+    Returns:
+        float32 array of the same shape with unit-length rows
+    """
+    arr = np.asarray(embeddings, dtype=np.float32)
+    if not arr.flags.writeable:
+        arr = arr.copy()
+    arr /= np.linalg.norm(arr, axis=-1, keepdims=True) + 1e-12
+    return arr
+
+
+def embed_query(text: str) -> np.ndarray:
+    """
+    Embed a single query string.
+    
+    Fast path for the query hot path: serves the vector from the cache, or posts
+    it once using the payload format already known to work, without the
+    batching and format negotiation of local_embedding. Falls back to
+    local_embedding when no format is known yet, the API rejects the request
+    (4xx) or the response cannot be parsed. Transport errors and 5xx
+    responses are raised straight away: the session has already retried
+    them, so a second attempt through local_embedding would only add latency.
+    With config.EMBED_COALESCE_MS set, cache misses are instead merged with
+    concurrent queries into one API call (see QueryBatcher).
+    
+    Args:
+        text: Query text
+        
+    Returns:
+        float32 vector of shape (dim,)
+        
+    Raises:
+        EmbeddingAPIError: If the text could not be embedded
+    """
+    cache = _get_cache()
+    if cache.enabled:
+        cached = cache.get_many([text])[0]
+        if cached is not None:
+            return np.asarray(cached, dtype=np.float32)
+    
+    if config.EMBED_COALESCE_MS > 0:
+        return _get_batcher().embed(text)
+    
+    field = _WORKING_FORMAT
+    if field is not None:
+        try:
+            response = _post_json({field: [text], "model": config.EMBEDDING_MODEL})
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error calling embedding API for query: {e}")
+            raise EmbeddingAPIError(f"Embedding API request failed for query: {e}") from e
+        if response.status_code >= 500:
+            logger.error(f"Embedding API returned status {response.status_code} for query")
+            raise EmbeddingAPIError(f"Embedding API returned status {response.status_code} for query")
+        if response.status_code == 200:
+            try:
+                vector = _parse_embeddings(orjson.loads(response.content))[0]
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Query embedding fast path could not parse response, falling back: {e}")
+            else:
+                cache.put_many([text], [vector])
+                return np.asarray(vector, dtype=np.float32)
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Query embedding fast path got status {response.status_code}, falling back")
+    
+    return local_embedding([text])[0]
+
+
+def local_embedding(texts: List[str], batch_size: int = 10, use_cache: bool = True) -> np.ndarray:
     """
     Generate embeddings for texts using the embedding API.
     
+    Repeated texts within the call are embedded once. Texts embedded before
+    are served from the on-disk cache (see config.EMBED_CACHE_DIR); only the
+    rest are sent to the API. Batches are sent concurrently (up to
+    config.EMBED_CONCURRENCY requests in flight) and reassembled in input order.
+    
+    Args:
+        texts: List of texts to embed
+        batch_size: Number of texts to process in each API call
+        use_cache: Whether to read and write the embedding cache
+        
+    Returns:
+        float32 array of shape (len(texts), dim), one row per text
+        
+    Raises:
+        EmbeddingAPIError: If any batch could not be embedded
+    """
+    # Embed each distinct text once, then fan the vectors back out by position
+    unique_texts = list(dict.fromkeys(texts))
+    if len(unique_texts) < len(texts):
+        logger.info(f"Deduplicated {len(texts)} texts to {len(unique_texts)} unique texts")
+        position = {text: i for i, text in enumerate(unique_texts)}
+        return _embed_unique(unique_texts, batch_size, use_cache)[[position[text] for text in texts]]
+    return _embed_unique(texts, batch_size, use_cache)
+
+
+def _embed_unique(texts: List[str], batch_size: int, use_cache: bool) -> np.ndarray:
+    """
+    Embed distinct texts, consulting the on-disk cache first.
+    
+    Args:
+        texts: Distinct texts to embed
+        batch_size: Number of texts to process in each API call
+        use_cache: Whether to read and write the embedding cache
+        
+    Returns:
+        float32 array of shape (len(texts), dim), in input order
+    """
+    cache = _get_cache() if use_cache else None
+    if cache is None or not cache.enabled:
+        return _embed_uncached(texts, batch_size)
+    
+    cached = cache.get_many(texts)
+    uncached_idx = [i for i, embedding in enumerate(cached) if embedding is None]
+    if len(uncached_idx) < len(texts):
+        logger.info(f"Embedding cache: {len(texts) - len(uncached_idx)}/{len(texts)} texts already embedded")
+    if not uncached_idx:
+        return np.stack(cached) if cached else _embed_uncached([], batch_size)
+    
+    uncached_texts = [texts[i] for i in uncached_idx]
+    new_embeddings = _embed_uncached(uncached_texts, batch_size)
+    cache.put_many(uncached_texts, new_embeddings)
+    if len(uncached_idx) == len(texts):
+        return new_embeddings
+    
+    # Splice cached and freshly embedded rows into one buffer
+    out = np.empty((len(texts), new_embeddings.shape[1]), dtype=np.float32)
+    for i, embedding in enumerate(cached):
+        if embedding is not None:
+            out[i] = embedding
+    out[uncached_idx] = new_embeddings
+    return out
+
+
+def _embed_uncached(texts: List[str], batch_size: int) -> np.ndarray:
+    """
+    Embed texts through the API, sending batches concurrently.
+    
+    Batches are written into one preallocated float32 buffer as they arrive.
+    
     Args:
         texts: List of texts to embed
         batch_size: Number of texts to process in each API call
         
     Returns:
-        List of embedding vectors (list of floats)
+        float32 array of shape (len(texts), dim), in input order
     """
     logger.info(f"Starting embedding generation: {len(texts)} texts")
     logger.info(f"Batch size: {batch_size}, API URL: {config.EMBEDDING_URL}")
     
-    all_embeddings = []
-    total_batches = (len(texts) + batch_size - 1) // batch_size
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    total_batches = len(batches)
     
-    for batch_num, i in enumerate(range(0, len(texts), batch_size), 1):
-        batch = texts[i:i + batch_size]
+    def embed_batch(batch_num: int, batch: List[str]) -> List[List[float]]:
         logger.info(f"Processing batch {batch_num}/{total_batches}: {len(batch)} texts")
-        
         batch_embeddings = _call_embedding_api(batch)
-        all_embeddings.extend(batch_embeddings)
-        
         logger.debug(f"Batch {batch_num} completed: {len(batch_embeddings)} embeddings generated")
+        return batch_embeddings
+    
+    out = None
     
-    logger.info(f"Embedding generation complete: {len(all_embeddings)} embeddings, "
-               f"dimension: {len(all_embeddings[0]) if all_embeddings else 0}")
+    def store(offset: int, batch_embeddings: List[List[float]]):
+        nonlocal out
+        # The buffer is uninitialized, so a short or ragged batch must fail
+        # rather than leave garbage rows that look like real embeddings
+        expected = min(batch_size, len(texts) - offset)
+        try:
+            batch_array = np.asarray(batch_embeddings, dtype=np.float32)
+        except ValueError as e:
+            raise EmbeddingAPIError(f"Embedding API returned malformed embeddings: {e}") from e
+        if batch_array.ndim != 2 or batch_array.shape[0] != expected:
+            raise EmbeddingAPIError(
+                f"Embedding API returned {len(batch_embeddings)} embeddings for {expected} texts"
+            )
+        if out is None:
+            # The first batch fixes the dimension
+            out = np.empty((len(texts), batch_array.shape[1]), dtype=np.float32)
+        elif batch_array.shape[1] != out.shape[1]:
+            raise EmbeddingAPIError(
+                f"Embedding API returned dimension {batch_array.shape[1]}, expected {out.shape[1]}"
+            )
+        out[offset:offset + expected] = batch_array
     
-    return all_embeddings
+    if total_batches <= 1:
+        for batch in batches:
+            store(0, embed_batch(1, batch))
+    else:
+        # The requests are network-bound, so threads overlap their round trips;
+        # map() yields results in submission order
+        workers = min(config.EMBED_CONCURRENCY, total_batches)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(embed_batch, range(1, total_batches + 1), batches)
+            for offset, batch_embeddings in zip(range(0, len(texts), batch_size), results):
+                store(offset, batch_embeddings)
+    
+    if out is None:
+        out = np.empty((0, config.EMBEDDING_DIMENSION), dtype=np.float32)
+    
+    logger.info(f"Embedding generation complete: {out.shape[0]} embeddings, dimension: {out.shape[1]}")
+    
+    return out
+
+
+def _embed_single(idx: int, text: str, total: int) -> List[float]:
+    """
+    Embed one text with the single-text request format.
+    
+    Args:
+        idx: 1-based position of the text, for logging
+        text: Text to embed
+        total: Number of texts in the batch, for logging
+        
+    Returns:
+        Embedding vector
+    """
+    alt_payload = {"texts": [text], "model": config.EMBEDDING_MODEL}
+    logger.debug(f"Processing text {idx}/{total} individually")
+    alt_response = _post_json(alt_payload)
+    if alt_response.status_code != 200:
+        logger.error(f"API error for text {idx}: {alt_response.status_code} - {alt_response.text}")
+        raise requests.exceptions.RequestException(
+            f"API error: {alt_response.status_code} - {alt_response.text}"
+        )
+    
+    embedding = _parse_embeddings(orjson.loads(alt_response.content))[0]
+    logger.debug(f"Text {idx}: Got embedding with {len(embedding)} dimensions")
+    return embedding
+
+
+def _parse_text_vectors(result) -> List[List[float]]:
+    """Parse {"data": {"text_vectors": [...]}} (API format)."""
+    return result["data"]["text_vectors"]
+
+
+def _parse_data_list(result) -> List[List[float]]:
+    """Parse {"data": [{"embedding": [...]}, ...]} (OpenAI-compatible format)."""
+    return [item["embedding"] for item in result["data"]]
+
+
+def _parse_embeddings_field(result) -> List[List[float]]:
+    """Parse {"embeddings": [...]} (alternative format)."""
+    return result["embeddings"]
+
+
+def _parse_single_embedding(result) -> List[List[float]]:
+    """Parse {"embedding": [...]} (single embedding)."""
+    return [result["embedding"]]
+
+
+def _parse_list(result) -> List[List[float]]:
+    """Parse a bare list of embeddings."""
+    if not isinstance(result, list):
+        raise TypeError(f"Expected a list, got {type(result).__name__}")
+    return result
+
+
+# Parsers for dict responses, keyed by the top-level field that identifies them
+_PARSERS = {
+    "embeddings": _parse_embeddings_field,
+    "embedding": _parse_single_embedding,
+}
+
+# Parser that handled the last response; tried first on the next one
+_WORKING_PARSER = None
+
+
+def _select_parser(result):
+    """
+    Pick the parser for a decoded embedding API response.
+    
+    Args:
+        result: Decoded JSON response body
+        
+    Returns:
+        Parser function
+    """
+    if isinstance(result, list):
+        return _parse_list
+    if not isinstance(result, dict):
+        logger.error(f"Unexpected API response type: {type(result)}")
+        raise ValueError(f"Unexpected API response format: {result}")
+    
+    if "data" in result:
+        data = result["data"]
+        if isinstance(data, dict) and "text_vectors" in data:
+            return _parse_text_vectors
+        if isinstance(data, list):
+            return _parse_data_list
+        logger.error(f"Unexpected 'data' format: {type(data)}, keys: {list(data.keys()) if isinstance(data, dict) else 'N/A'}")
+        raise ValueError(f"Unexpected 'data' format: {data}")
+    
+    for field, parser in _PARSERS.items():
+        if field in result:
+            return parser
+    logger.error(f"Unexpected API response format. Keys: {list(result.keys())}")
+    raise ValueError(f"Unexpected API response format: {result}")
+
+
+def _parse_embeddings(result) -> List[List[float]]:
+    """
+    Extract embedding vectors from a decoded embedding API response.
+    
+    The parser that matched the previous response is tried first, so a
+    stable API costs a single function call per batch; format detection
+    only runs again if it no longer fits.
+    
+    Args:
+        result: Decoded JSON response body
+        
+    Returns:
+        List of embedding vectors
+    """
+    global _WORKING_PARSER
+    parser = _WORKING_PARSER
+    if parser is not None:
+        try:
+            return parser(result)
+        except (KeyError, TypeError, IndexError):
+            pass
+    
+    parser = _select_parser(result)
+    embeddings = parser(result)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Parsed {len(embeddings)} embeddings with {parser.__name__}")
+    _WORKING_PARSER = parser
+    return embeddings
 
 
 def _call_embedding_api(texts: List[str]) -> List[List[float]]:
@@ -52,82 +518,43 @@ def _call_embedding_api(texts: List[str]) -> List[List[float]]:
         
     Returns:
         List of embedding vectors
+        
+    Raises:
+        EmbeddingAPIError: If the API fails after retries or returns an unusable response
     """
+    global _WORKING_FORMAT
     try:
-        # Try with "texts" field (as API expects)
-        payload = {
-            "texts": texts,
-            "model": config.EMBEDDING_MODEL
-        }
-        
-        logger.debug(f"API request: {len(texts)} texts, model: {config.EMBEDDING_MODEL}")
-        
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(
-            config.EMBEDDING_URL,
-            json=payload,
-            headers=headers,
-            timeout=30
-        )
-        
-        logger.debug(f"API response status: {response.status_code}")
-        
-        # If 422, try OpenAI-compatible format
-        if response.status_code == 422:
-            logger.warning(f"422 error with 'texts' format, trying OpenAI-compatible 'input' format")
+        # Use the format known to work; otherwise probe "texts" (as the API
+        # expects) and then the OpenAI-compatible "input" field
+        formats = [_WORKING_FORMAT] if _WORKING_FORMAT else ["texts", "input"]
+        for field in formats:
             payload = {
-                "input": texts,
+                field: texts,
                 "model": config.EMBEDDING_MODEL
             }
-            response = requests.post(
-                config.EMBEDDING_URL,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            logger.debug(f"API response status (input format): {response.status_code}")
+            
+            logger.debug(f"API request: {len(texts)} texts, model: {config.EMBEDDING_MODEL}, format: '{field}'")
+            
+            response = _post_json(payload)
+            
+            logger.debug(f"API response status: {response.status_code}")
+            if response.status_code != 422:
+                break
+            logger.warning(f"422 error with '{field}' format")
         
         # If still 422, try individual text format
         if response.status_code == 422:
             logger.warning(f"422 error with batch format, trying individual text format")
-            # Try alternative format - process texts one by one
-            embeddings = []
-            for idx, text in enumerate(texts):
-                alt_payload = {"texts": [text], "model": config.EMBEDDING_MODEL}
-                logger.debug(f"Processing text {idx+1}/{len(texts)} individually")
-                alt_response = requests.post(
-                    config.EMBEDDING_URL,
-                    json=alt_payload,
-                    headers=headers,
-                    timeout=30
-                )
-                if alt_response.status_code == 200:
-                    alt_result = alt_response.json()
-                    # Handle response with text_vectors format
-                    if "data" in alt_result and isinstance(alt_result["data"], dict) and "text_vectors" in alt_result["data"]:
-                        text_vectors = alt_result["data"]["text_vectors"]
-                        if text_vectors and len(text_vectors) > 0:
-                            embeddings.append(text_vectors[0])
-                            logger.debug(f"Text {idx+1}: Got embedding with {len(text_vectors[0])} dimensions from text_vectors")
-                    elif "data" in alt_result and isinstance(alt_result["data"], list) and len(alt_result["data"]) > 0:
-                        embeddings.append(alt_result["data"][0]["embedding"])
-                        logger.debug(f"Text {idx+1}: Got embedding from data array")
-                    elif "embedding" in alt_result:
-                        embeddings.append(alt_result["embedding"])
-                        logger.debug(f"Text {idx+1}: Got embedding with {len(alt_result['embedding'])} dimensions")
-                    elif "embeddings" in alt_result and len(alt_result["embeddings"]) > 0:
-                        embeddings.append(alt_result["embeddings"][0])
-                        logger.debug(f"Text {idx+1}: Got embedding from embeddings array")
-                    else:
-                        raise ValueError(f"Unexpected API response: {alt_result}")
-                else:
-                    logger.error(f"API error for text {idx+1}: {alt_response.status_code} - {alt_response.text}")
-                    raise requests.exceptions.RequestException(
-                        f"API error: {alt_response.status_code} - {alt_response.text}"
-                    )
+            # Try alternative format - one request per text, sent concurrently;
+            # map() keeps input order and re-raises the first failure
+            workers = min(config.EMBED_FALLBACK_WORKERS, len(texts))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                embeddings = list(executor.map(
+                    _embed_single,
+                    range(1, len(texts) + 1),
+                    texts,
+                    repeat(len(texts))
+                ))
             logger.info(f"Successfully generated {len(embeddings)} embeddings using individual format")
             return embeddings
         
@@ -135,46 +562,20 @@ def _call_embedding_api(texts: List[str]) -> List[List[float]]:
         
         # Try to parse JSON response
         try:
-            result = response.json()
+            result = orjson.loads(response.content)
         except ValueError:
             logger.error(f"API returned non-JSON response: {response.text[:200]}")
             raise ValueError(f"API returned non-JSON response: {response.text[:200]}")
         
-        logger.debug(f"API response keys: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
-        
-        # Handle different response formats
-        if isinstance(result, dict):
-            if "data" in result:
-                data = result["data"]
-                # Check if data is a dict with "text_vectors" (API format)
-                if isinstance(data, dict) and "text_vectors" in data:
-                    embeddings = data["text_vectors"]
-                    logger.debug(f"Got embeddings from 'data.text_vectors' field: {len(embeddings)} embeddings")
-                # Check if data is a list (OpenAI-compatible format)
-                elif isinstance(data, list):
-                    embeddings = [item["embedding"] for item in data]
-                    logger.debug(f"Got embeddings from 'data' list: {len(embeddings)} embeddings")
-                else:
-                    logger.error(f"Unexpected 'data' format: {type(data)}, keys: {list(data.keys()) if isinstance(data, dict) else 'N/A'}")
-                    raise ValueError(f"Unexpected 'data' format: {data}")
-            elif "embeddings" in result:
-                # Alternative format
-                embeddings = result["embeddings"]
-                logger.debug(f"Got embeddings from 'embeddings' field: {len(embeddings)} embeddings")
-            elif "embedding" in result:
-                # Single embedding (shouldn't happen with batch, but handle it)
-                embeddings = [result["embedding"]]
-                logger.debug(f"Got single embedding from 'embedding' field")
-            else:
-                logger.error(f"Unexpected API response format. Keys: {list(result.keys())}")
-                raise ValueError(f"Unexpected API response format: {result}")
-        elif isinstance(result, list):
-            # Direct list of embeddings
-            embeddings = result
-            logger.debug(f"Got embeddings as direct list: {len(embeddings)} embeddings")
-        else:
-            logger.error(f"Unexpected API response type: {type(result)}")
-            raise ValueError(f"Unexpected API response format: {result}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"API response keys: {list(result.keys()) if isinstance(result, dict) else 'Not a dict'}")
+        
+        embeddings = _parse_embeddings(result)
+        
+        # Remember the accepted format so later calls skip the probing
+        if _WORKING_FORMAT != field:
+            with _WORKING_LOCK:
+                _WORKING_FORMAT = field
         
         if embeddings:
             logger.info(f"Successfully generated {len(embeddings)} embeddings with {len(embeddings[0])} dimensions")
@@ -188,19 +589,15 @@ def _call_embedding_api(texts: List[str]) -> List[List[float]]:
             logger.error(f"  Response text (first 500 chars): {response.text[:500]}")
         else:
             logger.error(f"  No response received")
-        logger.warning(f"Returning zero vectors as fallback for {len(texts)} texts")
-        # Return zero vectors as fallback
-        return [[0.0] * config.EMBEDDING_DIMENSION for _ in texts]
+        # Zero vectors would be indexed as garbage, so fail the batch instead
+        raise EmbeddingAPIError(f"Embedding API request failed for {len(texts)} texts: {e}") from e
     except Exception as e:
-        logger.error(f"Error processing embeddings: {e}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error(f"Error processing embeddings: {e}", exc_info=True)
         if 'response' in locals():
             try:
                 logger.error(f"  Response status: {response.status_code}")
                 logger.error(f"  Response text (first 500 chars): {response.text[:500]}")
             except:
                 pass
-        logger.warning(f"Returning zero vectors as fallback for {len(texts)} texts")
-        return [[0.0] * config.EMBEDDING_DIMENSION for _ in texts]
+        raise EmbeddingAPIError(f"Could not embed {len(texts)} texts: {e}") from e
 
@@ -0,0 +1,152 @@
+"""
+Embedding Cache Module
+Persists embeddings on disk so re-ingesting the same text skips the embedding API.
+"""
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import numpy as np
+from . import config
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# Maximum number of bound parameters per SQLite statement
+_SQL_BATCH = 500
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store keyed by sha256(model:text), fronted by an in-memory LRU."""
+    
+    def __init__(self, cache_dir: str = None, model: str = None, memory_size: int = None):
+        """
+        Initialize embedding cache.
+        
+        Args:
+            cache_dir: Directory holding the cache database (default from config;
+                an empty value disables the on-disk tier)
+            model: Embedding model name, part of every key (default from config)
+            memory_size: Embeddings kept in memory (default from config; 0
+                disables the in-memory tier)
+        """
+        self.cache_dir = config.EMBED_CACHE_DIR if cache_dir is None else cache_dir
+        self.model = model or config.EMBEDDING_MODEL
+        self.memory_size = config.EMBED_MEMORY_CACHE_SIZE if memory_size is None else memory_size
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        # Most recently used embeddings by key hash, checked before the database
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            db_path = os.path.join(self.cache_dir, "embeddings.sqlite3")
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, "
+                "text_hash TEXT NOT NULL, "
+                "vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._conn.commit()
+            logger.info(f"Embedding cache enabled: {db_path}")
+    
+    @property
+    def enabled(self) -> bool:
+        """True if either cache tier is active."""
+        return self._conn is not None or self.memory_size > 0
+    
+    def _hash(self, text: str) -> str:
+        """Return the cache key hash for a text under this cache's model."""
+        return hashlib.sha256(f"{self.model}:{text}".encode("utf-8")).hexdigest()
+    
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up cached embeddings.
+        
+        Args:
+            texts: Texts to look up
+        
+        Returns:
+            One entry per text: the cached float32 embedding (a read-only view
+            of the stored bytes), or None on a miss
+        """
+        if not self.enabled or not texts:
+            return [None] * len(texts)
+        
+        hashes = [self._hash(text) for text in texts]
+        found = {}
+        with self._memory_lock:
+            for h in hashes:
+                vector = self._memory.get(h)
+                if vector is not None:
+                    self._memory.move_to_end(h)
+                    found[h] = vector
+        
+        missing = [h for h in hashes if h not in found]
+        if missing and self._conn is not None:
+            from_disk = {}
+            with self._lock:
+                for i in range(0, len(missing), _SQL_BATCH):
+                    batch = missing[i:i + _SQL_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                        [self.model, *batch]
+                    )
+                    for text_hash, vector in rows:
+                        from_disk[text_hash] = np.frombuffer(vector, dtype=np.float32)
+            self._remember(from_disk.items())
+            found.update(from_disk)
+        
+        logger.debug(f"Embedding cache: {len(found)}/{len(texts)} hits")
+        return [found.get(h) for h in hashes]
+    
+    def _remember(self, items):
+        """Add (hash, vector) pairs to the in-memory tier, evicting the least recently used."""
+        if self.memory_size <= 0:
+            return
+        with self._memory_lock:
+            for h, vector in items:
+                self._memory[h] = vector
+                self._memory.move_to_end(h)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+    
+    def put_many(self, texts: List[str], embeddings: Sequence):
+        """
+        Store embeddings for texts.
+        
+        Zero vectors are never stored, since they are not valid embeddings.
+        
+        Args:
+            texts: Texts that were embedded
+            embeddings: Embedding vectors corresponding to texts (lists or array rows)
+        """
+        if not self.enabled:
+            return
+        
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32)
+            if not vector.any():
+                continue
+            rows.append((self.model, self._hash(text), vector.tobytes()))
+        
+        # The memory tier holds read-only views of the stored bytes, like disk hits
+        self._remember((h, np.frombuffer(blob, dtype=np.float32)) for _, h, blob in rows)
+        
+        if not rows or self._conn is None:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
@@ -2,12 +2,129 @@
 Elasticsearch Indexing Module
 Stores content and vectors in Elasticsearch.
 """
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Set
+import hashlib
 import logging
+import threading
+from contextlib import contextmanager
+import numpy as np
+import orjson
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.exceptions import SerializationError
+from elasticsearch.helpers import parallel_bulk
+from elasticsearch.serializer import JSONSerializer, NdjsonSerializer
 from . import config
-import json
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+def quantize_int8(vectors: np.ndarray) -> np.ndarray:
+    """
+    Symmetrically quantize vectors to int8, scaling each row by its max magnitude.
+    
+    Per-row scaling does not change direction, so cosine similarity between
+    quantized vectors approximates the float similarity.
+    
+    Args:
+        vectors: (N, dim) or (dim,) float array
+        
+    Returns:
+        int8 array of the same shape
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    max_abs = np.max(np.abs(vectors), axis=-1, keepdims=True)
+    scaled = vectors / np.maximum(max_abs, 1e-12) * 127
+    return np.clip(np.round(scaled), -128, 127).astype(np.int8)
+
+
+class ORJSONSerializer(JSONSerializer):
+    """
+    JSON serializer backed by orjson, used for request and response bodies.
+    
+    NumPy arrays are encoded natively (OPT_SERIALIZE_NUMPY), so embedding
+    vectors never get boxed into Python floats; anything orjson cannot encode
+    directly falls through to the base class default().
+    """
+    
+    def dumps(self, data) -> bytes:
+        # Bodies that are already encoded are forwarded as-is
+        if isinstance(data, str):
+            return data.encode("utf-8", "surrogatepass")
+        if isinstance(data, bytes):
+            return data
+        try:
+            return orjson.dumps(data, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY)
+        except (TypeError, ValueError) as e:
+            raise SerializationError(message=f"Unable to serialize to JSON: {data!r} (type: {type(data).__name__})", errors=(e,))
+    
+    def loads(self, data: bytes):
+        try:
+            return orjson.loads(data)
+        except (TypeError, ValueError) as e:
+            raise SerializationError(message=f"Unable to deserialize as JSON: {data!r}", errors=(e,))
+
+
+class ORJSONNdjsonSerializer(NdjsonSerializer):
+    """NDJSON serializer (msearch and other line-delimited bodies) backed by orjson."""
+    
+    def json_dumps(self, data) -> bytes:
+        return orjson.dumps(data, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY)
+    
+    def json_loads(self, data: bytes):
+        return orjson.loads(data)
+
+
+# Maximum number of ids per mget request
+_MGET_BATCH = 1000
+
+_CLIENT: Optional[Elasticsearch] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _create_client() -> Elasticsearch:
+    """Create and configure Elasticsearch client."""
+    kwargs = dict(
+        verify_certs=config.ELASTICSEARCH_VERIFY_CERTS,
+        ssl_show_warn=False,
+        http_compress=True,
+        request_timeout=60,
+        max_retries=5,
+        retry_on_timeout=True,
+        connections_per_node=config.ES_CONNECTIONS_PER_NODE,
+        serializers={
+            "application/json": ORJSONSerializer(),
+            "application/x-ndjson": ORJSONNdjsonSerializer()
+        }
+    )
+    
+    # Determine authentication method
+    if config.ELASTICSEARCH_API_KEY:
+        # Use API key authentication
+        kwargs["api_key"] = config.ELASTICSEARCH_API_KEY
+    elif config.ELASTICSEARCH_PASSWORD:
+        # Use basic authentication
+        kwargs["basic_auth"] = (config.ELASTICSEARCH_USER, config.ELASTICSEARCH_PASSWORD)
+    
+    return Elasticsearch([config.ELASTICSEARCH_HOST], **kwargs)
+
+
+def get_client() -> Elasticsearch:
+    """
+    Return the shared Elasticsearch client, creating it on first use.
+    
+    Reusing one client keeps a single connection pool for the process
+    instead of opening new connections for every indexer or retriever.
+    
+    Returns:
+        Configured Elasticsearch client
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = _create_client()
+    return _CLIENT
 
 
 class ESIndexer:
@@ -15,37 +132,15 @@ class ESIndexer:
     
     def __init__(self):
         """Initialize Elasticsearch client."""
-        self.client = self._create_client()
+        self.client = get_client()
         self.index_name = config.ELASTICSEARCH_INDEX_NAME
-    
-    def _create_client(self) -> Elasticsearch:
-        """Create and configure Elasticsearch client."""
-        # Determine authentication method
-        if config.ELASTICSEARCH_API_KEY:
-            # Use API key authentication
-            es_client = Elasticsearch(
-                [config.ELASTICSEARCH_HOST],
-                api_key=config.ELASTICSEARCH_API_KEY,
-                verify_certs=config.ELASTICSEARCH_VERIFY_CERTS,
-                ssl_show_warn=False
-            )
-        elif config.ELASTICSEARCH_PASSWORD:
-            # Use basic authentication
-            es_client = Elasticsearch(
-                [config.ELASTICSEARCH_HOST],
-                basic_auth=(config.ELASTICSEARCH_USER, config.ELASTICSEARCH_PASSWORD),
-                verify_certs=config.ELASTICSEARCH_VERIFY_CERTS,
-                ssl_show_warn=False
-            )
-        else:
-            # No authentication
-            es_client = Elasticsearch(
-                [config.ELASTICSEARCH_HOST],
-                verify_certs=config.ELASTICSEARCH_VERIFY_CERTS,
-                ssl_show_warn=False
-            )
-        
-        return es_client
+        # Serializes index creation when several PDFs are ingested in parallel
+        self._create_lock = threading.Lock()
+        # Set once the index is known to exist, so repeated calls skip the round trip
+        self._index_ready = False
+        # Number of active bulk_load() blocks; settings are restored when it drops to 0
+        self._bulk_loaders = 0
+        self._bulk_lock = threading.Lock()
     
     def create_index(self, dimension: int = None) -> bool:
         """
@@ -59,110 +154,254 @@ class ESIndexer:
         """
         dimension = dimension or config.EMBEDDING_DIMENSION
         
-        # Check if index already exists
-        if self.client.indices.exists(index=self.index_name):
-            logging.getLogger(__name__).info("Index '%s' already exists.", self.index_name)
+        if self._index_ready:
             return True
         
-        # Define index mapping with dense_vector for embeddings
-        mapping = {
-            "mappings": {
-                "properties": {
-                    "text": {
-                        "type": "text",
-                        "analyzer": "standard"
-                    },
-                    "embedding": {
-                        "type": "dense_vector",
-                        "dims": dimension,
-                        "index": True,
-                        "similarity": "cosine"
-                    },
-                    "chunk_id": {
-                        "type": "integer"
-                    },
-                    "metadata": {
-                        "type": "object",
-                        "properties": {
-                            "title": {"type": "text"},
-                            "author": {"type": "text"},
-                            "file_name": {"type": "keyword"},
-                            "file_path": {"type": "keyword"},
-                            "total_pages": {"type": "integer"},
-                            "page_number": {"type": "integer"}
+        with self._create_lock:
+            # Check if index already exists
+            if self._index_ready:
+                return True
+            if self.client.indices.exists(index=self.index_name):
+                logger.info("Index '%s' already exists.", self.index_name)
+                self._index_ready = True
+                return True
+            
+            # Vectors are L2-normalized at ingest, so dot product equals cosine and
+            # ES skips the per-candidate norm computation. dot_product requires
+            # every stored and query vector to be unit-length. int8 vectors lose
+            # unit length when quantized and use cosine instead.
+            if config.EMBEDDING_QUANTIZE_INT8:
+                vector_mapping = {"element_type": "byte", "similarity": "cosine"}
+            else:
+                vector_mapping = {"element_type": "float", "similarity": "dot_product"}
+            
+            # Define index mapping with dense_vector for embeddings
+            mapping = {
+                "mappings": {
+                    "properties": {
+                        "text": {
+                            "type": "text",
+                            "analyzer": "standard"
+                        },
+                        "embedding": {
+                            "type": "dense_vector",
+                            "dims": dimension,
+                            "index": True,
+                            **vector_mapping
+                        },
+                        "chunk_id": {
+                            "type": "integer"
+                        },
+                        "metadata": {
+                            "type": "object",
+                            "properties": {
+                                "title": {"type": "text"},
+                                "author": {"type": "text"},
+                                "file_name": {"type": "keyword"},
+                                "file_path": {"type": "keyword"},
+                                "total_pages": {"type": "integer"},
+                                "page_number": {"type": "integer"}
+                            }
                         }
                     }
                 }
             }
-        }
+            
+            try:
+                # Use mappings parameter for newer Elasticsearch client versions
+                self.client.indices.create(
+                    index=self.index_name,
+                    mappings=mapping["mappings"]
+                )
+                logger.info("Index '%s' created successfully.", self.index_name)
+                self._index_ready = True
+                return True
+            except Exception as e:
+                # Fallback to body parameter for older versions
+                try:
+                    self.client.indices.create(index=self.index_name, body=mapping)
+                    logger.info("Index '%s' created successfully.", self.index_name)
+                    self._index_ready = True
+                    return True
+                except Exception as e2:
+                    logger.error("Error creating index: %s", e2, exc_info=True)
+                    return False
+    
+    @contextmanager
+    def bulk_load(self):
+        """
+        Relax refresh and translog durability while documents are bulk loaded.
         
+        Periodic refreshes are disabled and the translog is fsynced
+        asynchronously until the block exits. Concurrent blocks (several PDFs
+        ingested in parallel) are reference counted; the index defaults are
+        restored and the index refreshed when the last one exits.
+        """
+        with self._bulk_lock:
+            if self._bulk_loaders == 0:
+                self._put_settings({"refresh_interval": "-1", "translog.durability": "async"})
+            self._bulk_loaders += 1
         try:
-            # Use mappings parameter for newer Elasticsearch client versions
-            self.client.indices.create(
-                index=self.index_name,
-                mappings=mapping["mappings"]
-            )
-            logging.getLogger(__name__).info("Index '%s' created successfully.", self.index_name)
-            return True
+            yield
+        finally:
+            with self._bulk_lock:
+                self._bulk_loaders -= 1
+                if self._bulk_loaders == 0:
+                    # None resets each setting to the index default
+                    self._put_settings({"refresh_interval": None, "translog.durability": None})
+                    try:
+                        self.client.indices.refresh(index=self.index_name)
+                    except Exception as e:
+                        logger.warning("Error refreshing index: %s", e)
+    
+    def _put_settings(self, settings: Dict):
+        """Apply dynamic index settings, logging instead of raising on failure."""
+        try:
+            self.client.indices.put_settings(index=self.index_name, settings={"index": settings})
         except Exception as e:
-            # Fallback to body parameter for older versions
-            try:
-                self.client.indices.create(index=self.index_name, body=mapping)
-                logging.getLogger(__name__).info("Index '%s' created successfully.", self.index_name)
-                return True
-            except Exception as e2:
-                logging.getLogger(__name__).error("Error creating index: %s", e2, exc_info=True)
-                return False
+            logger.warning("Error updating index settings %s: %s", settings, e)
     
-    def index_documents(self, chunks: List[Dict], embeddings: List[List[float]]) -> bool:
+    @staticmethod
+    def doc_id(chunk: Dict) -> str:
         """
-        Index documents with their embeddings.
+        Return the content-hash document id for a chunk.
+        
+        The id covers the source file name, chunk position and text, so
+        re-indexing an unchanged chunk overwrites the same document instead of
+        adding a duplicate.
         
         Args:
-            chunks: List of chunk dictionaries with text and metadata
-            embeddings: List of embedding vectors corresponding to chunks
+            chunk: Chunk dictionary with text, chunk_id and metadata
             
         Returns:
-            True if indexing was successful
+            Hex SHA-256 document id
         """
-        if len(chunks) != len(embeddings):
-            raise ValueError("Number of chunks must match number of embeddings")
+        metadata = chunk.get("metadata") or {}
+        key = f"{metadata.get('file_name', '')}:{chunk.get('chunk_id')}:{chunk['text']}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+    
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """
+        Return which document ids are already in the index.
         
-        # Ensure index exists
-        self.create_index()
+        Uses realtime mget, so documents indexed while refresh is disabled
+        are found as well.
         
-        # Prepare documents for bulk indexing
-        actions = []
+        Args:
+            ids: Document ids to check
+            
+        Returns:
+            Set of ids that exist (empty on error)
+        """
+        found = set()
+        try:
+            for i in range(0, len(ids), _MGET_BATCH):
+                response = self.client.mget(
+                    index=self.index_name,
+                    ids=ids[i:i + _MGET_BATCH],
+                    source=False,
+                    filter_path=["docs._id", "docs.found"]
+                )
+                found.update(doc["_id"] for doc in response.get("docs", []) if doc.get("found"))
+        except Exception as e:
+            logger.warning("Error checking existing documents: %s", e)
+            return set()
+        return found
+    
+    def _iter_actions(self, chunks: List[Dict], embeddings: np.ndarray) -> Iterator[Dict]:
+        """
+        Yield bulk index actions one at a time.
+        
+        Args:
+            chunks: List of chunk dictionaries with text and metadata
+            embeddings: Normalized (N, dim) embedding matrix (float32 or int8)
+            
+        Yields:
+            Bulk action dictionaries
+        """
         for chunk, embedding in zip(chunks, embeddings):
-            doc = {
+            yield {
                 "_index": self.index_name,
+                "_id": self.doc_id(chunk),
                 "_source": {
                     "text": chunk["text"],
+                    # Row of a C-contiguous matrix; serialized natively by ORJSONSerializer
                     "embedding": embedding,
                     "chunk_id": chunk["chunk_id"],
                     "metadata": chunk.get("metadata", {})
                 }
             }
-            actions.append(doc)
+    
+    def index_documents(self, chunks: List[Dict], embeddings: List[List[float]]) -> bool:
+        """
+        Index documents with their embeddings.
+        
+        Args:
+            chunks: List of chunk dictionaries with text and metadata
+            embeddings: Embedding vectors corresponding to chunks (list of lists or
+                a 2-D array of any float dtype)
+            
+        Returns:
+            True if indexing was successful
+        """
+        if len(chunks) != len(embeddings):
+            raise ValueError("Number of chunks must match number of embeddings")
+        
+        # Ensure index exists
+        self.create_index()
+        
+        # Nothing to index; also keeps E below from being 1-D
+        if not chunks:
+            return True
+        
+        # dot_product similarity requires unit-length vectors; normalize all rows at once
+        E = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(E, axis=1, keepdims=True)
+        
+        # All-zero rows are placeholders, not embeddings; never index them
+        valid = norms[:, 0] > 0
+        if not valid.all():
+            logger.warning(
+                "Skipping %d chunks with zero-vector embeddings.", int((~valid).sum())
+            )
+            chunks = [chunk for chunk, keep in zip(chunks, valid) if keep]
+            E, norms = E[valid], norms[valid]
+            if not chunks:
+                return False
+        E /= norms
+        if config.EMBEDDING_QUANTIZE_INT8:
+            E = quantize_int8(E)
         
         try:
-            # Bulk index documents
-            success, failed = bulk(self.client, actions, chunk_size=100, raise_on_error=False)
+            # Bulk index documents across worker threads, streaming actions
+            # so only the chunks in flight are serialized at any time
+            success = 0
+            failed = []
+            for ok, info in parallel_bulk(
+                self.client,
+                self._iter_actions(chunks, E),
+                thread_count=config.ES_BULK_THREADS,
+                chunk_size=config.ES_BULK_CHUNK_SIZE,
+                queue_size=4,
+                raise_on_error=False
+            ):
+                if ok:
+                    success += 1
+                else:
+                    failed.append(info)
             
             if failed:
-                logging.getLogger(__name__).warning("%d documents failed to index.", len(failed))
+                logger.warning("%d documents failed to index.", len(failed))
                 # Print first few errors for debugging
                 for i, error in enumerate(failed[:3]):
-                    logging.getLogger(__name__).warning("  Error %d: %s", i+1, error)
+                    logger.warning("  Error %d: %s", i+1, error)
                 return False
             
-            logging.getLogger(__name__).info("Successfully indexed %d documents.", success)
+            logger.info("Successfully indexed %d documents.", success)
             return True
             
         except Exception as e:
-            logging.getLogger(__name__).error("Error indexing documents: %s", e, exc_info=True)
-            import traceback
-            traceback.print_exc()
+            logger.error("Error indexing documents: %s", e, exc_info=True)
             return False
     
     def delete_index(self) -> bool:
@@ -175,13 +414,14 @@ class ESIndexer:
         try:
             if self.client.indices.exists(index=self.index_name):
                 self.client.indices.delete(index=self.index_name)
-                logging.getLogger(__name__).info("Index '%s' deleted successfully.", self.index_name)
+                self._index_ready = False
+                logger.info("Index '%s' deleted successfully.", self.index_name)
                 return True
             else:
-                logging.getLogger(__name__).info("Index '%s' does not exist.", self.index_name)
+                logger.info("Index '%s' does not exist.", self.index_name)
                 return False
         except Exception as e:
-            logging.getLogger(__name__).error("Error deleting index: %s", e, exc_info=True)
+            logger.error("Error deleting index: %s", e, exc_info=True)
             return False
     
     def get_index_stats(self) -> Dict:
@@ -195,9 +435,41 @@ class ESIndexer:
             stats = self.client.indices.stats(index=self.index_name)
             return stats
         except Exception as e:
-            logging.getLogger(__name__).error("Error getting index stats: %s", e, exc_info=True)
+            logger.error("Error getting index stats: %s", e, exc_info=True)
             return {}
     
+    def count_zero_vectors(self) -> Optional[int]:
+        """
+        Count documents whose embedding is all zeros.
+        
+        The check runs as a script query inside Elasticsearch, so no
+        vector data is transferred to the client.
+        
+        Returns:
+            Number of zero-vector documents, or None on error
+        """
+        zero_vector_script = """
+            if (doc['embedding'].size() == 0) {
+                return false;
+            }
+            float[] v = doc['embedding'].vectorValue;
+            for (int i = 0; i < v.length; i++) {
+                if (v[i] != 0) {
+                    return false;
+                }
+            }
+            return true;
+        """
+        try:
+            response = self.client.count(
+                index=self.index_name,
+                query={"script": {"script": {"source": zero_vector_script}}}
+            )
+            return response["count"]
+        except Exception as e:
+            logger.error("Error counting zero vectors: %s", e, exc_info=True)
+            return None
+    
     def test_connection(self) -> bool:
         """
         Test connection to Elasticsearch.
@@ -207,9 +479,9 @@ class ESIndexer:
         """
         try:
             info = self.client.info()
-            logging.getLogger(__name__).info("Connected to Elasticsearch: %s", info['version']['number'])
+            logger.info("Connected to Elasticsearch: %s", info['version']['number'])
             return True
         except Exception as e:
-            logging.getLogger(__name__).error("Error connecting to Elasticsearch: %s", e, exc_info=True)
+            logger.error("Error connecting to Elasticsearch: %s", e, exc_info=True)
             return False
 
@@ -0,0 +1,57 @@
+"""
+HTTP Session Module
+Builds pooled requests sessions shared by the HTTP API clients.
+"""
+from typing import Iterable
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def create_session(
+    pool_connections: int = 16,
+    pool_maxsize: int = 64,
+    retries: int = 3,
+    backoff_factor: float = 0.3,
+    status_forcelist: Iterable[int] = (429, 500, 502, 503, 504),
+    backoff_jitter: float = 0.0
+) -> requests.Session:
+    """
+    Create a requests session with connection pooling and retries.
+    
+    Reusing one session keeps TCP/TLS connections alive across calls instead
+    of paying a fresh handshake on every request.
+    
+    Args:
+        pool_connections: Number of per-host connection pools to cache
+        pool_maxsize: Maximum connections kept per host
+        retries: Retries on connection errors, timeouts and retryable statuses
+        backoff_factor: Exponential backoff factor between retries
+        status_forcelist: Response statuses that trigger a retry
+        backoff_jitter: Random extra delay (seconds, up to this value) added to
+            each backoff so concurrent clients do not retry in lockstep
+        
+    Returns:
+        Configured requests session
+    """
+    retry_kwargs = dict(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=list(status_forcelist),
+        # The APIs are all called with POST, which urllib3 does not retry by default
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        # Hand the final response back so callers can log and handle the status
+        raise_on_status=False
+    )
+    try:
+        retry = Retry(backoff_jitter=backoff_jitter, **retry_kwargs)
+    except TypeError:
+        # urllib3 < 2 has no backoff_jitter
+        retry = Retry(**retry_kwargs)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
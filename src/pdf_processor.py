@@ -3,7 +3,9 @@ PDF Processing Module
 Extracts text from PDF files using LangChain's PyMuPDFLoader.
 """
 import os
-from typing import Dict, List
+from collections.abc import Mapping
+from functools import cached_property
+from typing import Dict, Iterator, List
 from langchain_community.document_loaders import PyMuPDFLoader
 
 try:
@@ -15,6 +17,44 @@ except ImportError:
         from langchain_core.documents import Document
 
 
+class ExtractedPDF(Mapping):
+    """
+    Result of PDFProcessor.extract_text.
+    
+    Behaves like the dictionary extract_text used to return, but the
+    combined "text" value is only joined from the pages on first access.
+    """
+    
+    _KEYS = ("text", "metadata", "pages")
+    
+    def __init__(self, metadata: Dict, pages: List[Dict]):
+        """
+        Initialize extraction result.
+        
+        Args:
+            metadata: PDF metadata dictionary
+            pages: List of {"page_number", "text"} dictionaries
+        """
+        self.metadata = metadata
+        self.pages = pages
+    
+    @cached_property
+    def text(self) -> str:
+        """Full document text, pages separated by blank lines."""
+        return "\n\n".join(page["text"] for page in self.pages)
+    
+    def __getitem__(self, key: str):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __iter__(self):
+        return iter(self._KEYS)
+    
+    def __len__(self) -> int:
+        return len(self._KEYS)
+
+
 class PDFProcessor:
     """Process PDF files and extract text content using PyMuPDFLoader."""
     
@@ -22,33 +62,45 @@ class PDFProcessor:
         """Initialize PDF processor."""
         pass
     
-    def load_pages(self, pdf_path: str) -> List[Document]:
+    def iter_pages(self, pdf_path: str) -> Iterator[Document]:
         """
-        Load PDF pages using PyMuPDFLoader.
+        Lazily load PDF pages using PyMuPDFLoader.
         
         Args:
             pdf_path: Path to the PDF file
             
-        Returns:
-            List of Document objects (one per page)
+        Yields:
+            Document objects, one per page
         """
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
         
-        # Load PDF using PyMuPDFLoader
+        # Stream pages from PyMuPDFLoader instead of loading them all at once
         loader = PyMuPDFLoader(pdf_path)
-        pages = loader.load()
-        
-        # Add file metadata to each page
         file_name = os.path.basename(pdf_path)
-        for page in pages:
+        for page in loader.lazy_load():
+            # Add file metadata to each page
             if page.metadata:
                 page.metadata["file_path"] = pdf_path
                 page.metadata["file_name"] = file_name
+            yield page
+    
+    def load_pages(self, pdf_path: str) -> List[Document]:
+        """
+        Load PDF pages using PyMuPDFLoader.
         
-        return pages
+        Args:
+            pdf_path: Path to the PDF file
+            
+        Returns:
+            List of Document objects (one per page)
+        """
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        
+        return list(self.iter_pages(pdf_path))
     
-    def extract_text(self, pdf_path: str) -> Dict[str, any]:
+    def extract_text(self, pdf_path: str) -> ExtractedPDF:
         """
         Extract text from a PDF file using PyMuPDFLoader (backward compatibility).
         
@@ -56,22 +108,25 @@ class PDFProcessor:
             pdf_path: Path to the PDF file
             
         Returns:
-            Dictionary containing:
-                - text: Extracted text content
+            Mapping containing:
+                - text: Extracted text content (joined lazily on first access)
                 - metadata: PDF metadata (title, author, pages, etc.)
                 - pages: List of text per page
         """
-        pages = self.load_pages(pdf_path)
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
         
-        # Extract text from all documents
-        text_content = []
+        # Collect per-page text in a single pass over the pages
         pages_text = []
+        first_doc_metadata = {}
+        total_pages = 0
         
-        # Get metadata from first document
-        first_doc_metadata = pages[0].metadata if pages else {}
-        
-        # Combine all page content
-        for doc in pages:
+        for doc in self.iter_pages(pdf_path):
+            if total_pages == 0:
+                # Get metadata from first document
+                first_doc_metadata = doc.metadata or {}
+            total_pages += 1
+            
             page_text = doc.page_content
             if page_text:
                 page_num = doc.metadata.get("page", len(pages_text) + 1)
@@ -79,7 +134,6 @@ class PDFProcessor:
                     "page_number": page_num,
                     "text": page_text
                 })
-                text_content.append(page_text)
         
         # Build metadata dictionary
         metadata = {
@@ -90,17 +144,9 @@ class PDFProcessor:
             "producer": first_doc_metadata.get("producer", ""),
             "creation_date": str(first_doc_metadata.get("creation_date", "")),
             "modification_date": str(first_doc_metadata.get("mod_date", "")),
-            "total_pages": len(pages),
+            "total_pages": total_pages,
             "file_path": pdf_path,
             "file_name": os.path.basename(pdf_path)
         }
         
-        # Combine all text
-        full_text = "\n\n".join(text_content)
-        
-        return {
-            "text": full_text,
-            "metadata": metadata,
-            "pages": pages_text
-        }
-
+        return ExtractedPDF(metadata, pages_text)
@@ -2,8 +2,13 @@
 RAG Pipeline Module
 Complete pipeline for processing PDFs and querying.
 """
+import copy
 import logging
-from typing import List, Dict, Optional
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Dict, Optional
+import numpy as np
 from .pdf_processor import PDFProcessor
 from .chunker import TextChunker
 from .es_indexer import ESIndexer
@@ -11,7 +16,7 @@ from .retriever import HybridRetriever
 from .reranker import Reranker
 from .answer_generator import AnswerGenerator
 from . import config
-from .embedding import local_embedding
+from .embedding import EmbeddingAPIError, embed_query, local_embedding, normalize_embeddings
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -22,21 +27,51 @@ class RAGPipeline:
     
     def __init__(self):
         """Initialize pipeline components."""
+        # Settings read on every query/ingest call, resolved once
+        self._cfg = config.pipeline_settings()
+        
         self.pdf_processor = PDFProcessor()
         self.chunker = TextChunker()
         self.indexer = ESIndexer()
         self.retriever = HybridRetriever()
         self.reranker = Reranker()
         self.answer_generator = AnswerGenerator()
+        
+        # LRU cache of answers for repeated identical queries
+        self._qcache = OrderedDict()
+        self._qcache_max = self._cfg.query_cache_size
+        self._qcache_lock = threading.Lock()
+        
+        # Semantic cache: unit-length query embeddings (one row per entry),
+        # the answers they produced and the top-k parameters used
+        self._cache_vecs = None
+        self._cache_answers: List[Dict] = []
+        self._cache_params: List[tuple] = []
     
     def process_documents(self, pdf_paths: List[str]) -> Dict[str, bool]:
-        """Process multiple PDF files and return success status per file."""
+        """
+        Process multiple PDF files and return success status per file.
+        
+        PDFs are processed concurrently (up to INGEST_CONCURRENCY at a
+        time) so PDF loading, embedding requests and bulk indexing of
+        different files overlap.
+        """
         results: Dict[str, bool] = {}
-        for pdf_path in pdf_paths:
-            logger.info("Processing PDF: %s", pdf_path)
-            success = self.process_pdf(pdf_path)
-            results[pdf_path] = success
-        return results
+        workers = max(1, min(self._cfg.ingest_concurrency, len(pdf_paths)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for pdf_path in pdf_paths:
+                logger.info("Processing PDF: %s", pdf_path)
+                futures[executor.submit(self.process_pdf, pdf_path)] = pdf_path
+            for future in as_completed(futures):
+                pdf_path = futures[future]
+                try:
+                    results[pdf_path] = future.result()
+                except Exception as e:
+                    logger.error("Error processing %s: %s", pdf_path, e, exc_info=True)
+                    results[pdf_path] = False
+        # Report results in input order
+        return {pdf_path: results[pdf_path] for pdf_path in pdf_paths}
     
     def process_pdf(self, pdf_path: str) -> bool:
         """
@@ -70,33 +105,108 @@ class RAGPipeline:
             logger.error(f"Chunking failed: {e}", exc_info=True)
             return False
         
-        # Step 3: Generate embeddings using local_embedding
-        logger.info("Step 3: Generating embeddings")
-        logger.info("Starting embedding generation")
-        try:
-            texts = [chunk["text"] for chunk in chunks]
-            logger.info(f"Preparing {len(texts)} texts for embedding")
-            embeddings = local_embedding(texts)
-            logger.info(f"Embedding generation completed: {len(embeddings)} embeddings")
-        except Exception as e:
-            logger.error(f"Embedding generation failed: {e}", exc_info=True)
-            return False
+        # Steps 3-4: Generate embeddings and index them in batches. Up to
+        # EMBED_PREFETCH batches are embedded in the background while the
+        # current one is indexed, so the embedding API and Elasticsearch work
+        # at the same time and a slow batch on either side does not stall the other.
+        logger.info("Steps 3-4: Generating embeddings and indexing in Elasticsearch")
+        batch_size = self._cfg.embed_batch_size
+        prefetch = max(1, self._cfg.embed_prefetch)
         
-        # Step 4: Index in Elasticsearch
-        logger.info("Step 4: Indexing in Elasticsearch")
         try:
             # Ensure index exists
             self.indexer.create_index()
-            
-            # Index documents
-            success = self.indexer.index_documents(chunks, embeddings)
-            if success:
-                logger.info("Successfully indexed %d documents", len(chunks))
-            else:
-                logger.error("Error indexing documents")
-                return False
         except Exception as e:
-            logger.error("Error indexing: %s", e, exc_info=True)
+            logger.error("Error creating index: %s", e, exc_info=True)
+            return False
+        
+        # Documents are keyed by content hash, so chunks already in the index
+        # (e.g. re-ingesting an unchanged PDF) need neither embedding nor indexing
+        doc_ids = [self.indexer.doc_id(chunk) for chunk in chunks]
+        indexed_ids = self.indexer.existing_ids(doc_ids)
+        if indexed_ids:
+            chunks = [chunk for chunk, doc_id in zip(chunks, doc_ids) if doc_id not in indexed_ids]
+            logger.info(f"{len(indexed_ids)} chunks already indexed, {len(chunks)} left to embed and index")
+            if not chunks:
+                logger.info("PDF processing completed successfully (already indexed)")
+                return True
+        
+        # Embed each distinct text once; repeated headers, footers and
+        # boilerplate share the embedding of their first occurrence
+        text_groups: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            text_groups.setdefault(chunk["text"], []).append(i)
+        texts = list(text_groups)
+        logger.info(f"Preparing {len(texts)} unique texts ({len(chunks)} chunks) for embedding in batches of {batch_size}")
+        
+        # Chunks left unindexed because their batch could not be embedded
+        failed_chunks = 0
+        
+        # Set once new chunks are indexed; cached answers are stale from then on
+        indexed_any = False
+        
+        try:
+            with self.indexer.bulk_load(), ThreadPoolExecutor(max_workers=prefetch) as executor:
+                # Bounded queue of (start offset, embedding future), in batch order
+                batch_starts = iter(range(0, len(texts), batch_size))
+                pending = deque()
+                
+                def submit_next():
+                    start = next(batch_starts, None)
+                    if start is not None:
+                        pending.append((start, executor.submit(self._embed_texts, texts[start:start + batch_size])))
+                
+                for _ in range(prefetch):
+                    submit_next()
+                
+                while pending:
+                    start, future = pending.popleft()
+                    batch_texts = texts[start:start + batch_size]
+                    try:
+                        embeddings = future.result()
+                        logger.info(f"Embedding generation completed: {len(embeddings)} embeddings")
+                    except EmbeddingAPIError as e:
+                        # Skip this batch rather than index placeholder vectors; the
+                        # missing chunks are picked up when the PDF is ingested again
+                        batch_failed = sum(len(text_groups[text]) for text in batch_texts)
+                        failed_chunks += batch_failed
+                        logger.error(f"Embedding generation failed, skipping {batch_failed} chunks: {e}")
+                        submit_next()
+                        continue
+                    except Exception as e:
+                        logger.error(f"Embedding generation failed: {e}", exc_info=True)
+                        return False
+                    
+                    # Keep the queue full before indexing this batch
+                    submit_next()
+                    
+                    # Fan each embedding back out to every chunk with that text
+                    batch_chunks = []
+                    rows = []
+                    for row, text in enumerate(batch_texts):
+                        for i in text_groups[text]:
+                            batch_chunks.append(chunks[i])
+                            rows.append(row)
+                    
+                    try:
+                        success = self.indexer.index_documents(batch_chunks, embeddings[rows])
+                        if success:
+                            indexed_any = True
+                            logger.info("Successfully indexed %d documents", len(batch_chunks))
+                        else:
+                            logger.error("Error indexing documents")
+                            return False
+                    except Exception as e:
+                        logger.error("Error indexing: %s", e, exc_info=True)
+                        return False
+        finally:
+            # Runs after bulk_load() has restored refresh, so the new chunks
+            # are searchable before cached answers are dropped
+            if indexed_any:
+                self._clear_query_caches()
+        
+        if failed_chunks:
+            logger.error(f"PDF processing incomplete: {failed_chunks} chunks could not be embedded")
             return False
         
         logger.info("PDF processing completed successfully")
@@ -104,11 +214,26 @@ class RAGPipeline:
     
     
     
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts (previously embedded ones are served from the on-disk cache).
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            float16 array of shape (len(texts), dim), rows in the same order as
+            texts. Half precision halves the memory held per in-flight batch;
+            the indexer upcasts to float32 when normalizing.
+        """
+        return np.asarray(local_embedding(texts), dtype=np.float16)
+    
     def query(
         self,
         query: str,
         top_k_retrieval: int = None,
-        top_k_rerank: int = None
+        top_k_rerank: int = None,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> Dict:
         """
         Query the RAG system with full pipeline.
@@ -117,44 +242,160 @@ class RAGPipeline:
             query: Query text
             top_k_retrieval: Number of documents to retrieve
             top_k_rerank: Number of documents to return after re-ranking
+            on_token: Optional callback receiving the answer text as it is
+                generated; cached answers are passed in a single call
             
         Returns:
             Query result with answer and sources
         """
+        top_k_retrieval = top_k_retrieval or self._cfg.retrieval_top_k
+        top_k_rerank = top_k_rerank or self._cfg.rerank_top_k
+        
+        # Serve repeated identical queries from the cache
+        cache_key = (query.strip().lower(), top_k_retrieval, top_k_rerank)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.info("Query cache hit")
+            if on_token:
+                on_token(cached["answer"])
+            return cached
+        
         try:
-            # Generate query embedding using local_embedding
-            query_embeddings = local_embedding([query])
-            query_embedding = query_embeddings[0] if query_embeddings else None
+            # Generate query embedding
+            try:
+                query_embedding = embed_query(query)
+            except EmbeddingAPIError as e:
+                logger.error(f"Query embedding generation failed: {e}")
+                return {"error": "Failed to generate query embedding"}
             
-            if not query_embedding or all(v == 0.0 for v in query_embedding):
+            if query_embedding.size == 0 or not query_embedding.any():
                 logger.error("Query embedding generation failed or returned zero vector")
                 return {"error": "Failed to generate query embedding"}
             
+            # Indexed vectors are unit-length (dot_product similarity), so the
+            # query vector must be too; the semantic cache relies on it as well
+            query_vector = normalize_embeddings(query_embedding)
+            
+            # Serve paraphrases of recent queries from the semantic cache
+            cached = self._semantic_get(query_vector, cache_key[1:])
+            if cached is not None:
+                logger.info("Semantic query cache hit")
+                if not cached.get("fallback"):
+                    self._cache_put(cache_key, cached)
+                if on_token:
+                    on_token(cached["answer"])
+                return cached
+            
             # Retrieve
             results = self.retriever.search(
                 query,
-                query_embedding,
-                top_k=top_k_retrieval or config.RETRIEVAL_TOP_K
+                query_vector,
+                top_k=top_k_retrieval
             )
             
             # Re-rank
             reranked = self.reranker.rerank(
                 query,
                 results,
-                top_k=top_k_rerank or config.RERANK_TOP_K
+                top_k=top_k_rerank
             )
             
             # Generate answer
             answer_data = self.answer_generator.generate_answer_with_sources(
                 query,
-                reranked
+                reranked,
+                on_token=on_token
             )
             
+            # Answers from an empty retrieval (e.g. Elasticsearch briefly down)
+            # or a failed LLM call are served but never cached
+            if results and not answer_data.get("fallback"):
+                self._cache_put(cache_key, answer_data)
+                self._semantic_put(query_vector, cache_key[1:], answer_data)
             return answer_data
             
         except Exception as e:
             return {"error": str(e)}
     
+    def _clear_query_caches(self):
+        """Drop cached answers, e.g. after new content was indexed."""
+        with self._qcache_lock:
+            self._qcache.clear()
+            self._cache_vecs = None
+            self._cache_answers = []
+            self._cache_params = []
+    
+    def _cache_get(self, key: tuple) -> Optional[Dict]:
+        """Return a copy of the cached answer for a query key, or None."""
+        with self._qcache_lock:
+            answer_data = self._qcache.get(key)
+            if answer_data is None:
+                return None
+            self._qcache.move_to_end(key)
+            return copy.deepcopy(answer_data)
+    
+    def _cache_put(self, key: tuple, answer_data: Dict):
+        """Store an answer, evicting the least recently used entry when full."""
+        if self._qcache_max <= 0:
+            return
+        with self._qcache_lock:
+            self._qcache[key] = copy.deepcopy(answer_data)
+            self._qcache.move_to_end(key)
+            if len(self._qcache) > self._qcache_max:
+                self._qcache.popitem(last=False)
+    
+    def _semantic_get(self, query_vector: np.ndarray, params: tuple) -> Optional[Dict]:
+        """
+        Return a copy of the answer for the most similar cached query.
+        
+        Args:
+            query_vector: Unit-length query embedding
+            params: (top_k_retrieval, top_k_rerank) the answer must match
+            
+        Returns:
+            Cached answer if its query is at least SEMANTIC_CACHE_THRESHOLD
+            similar to this one, otherwise None
+        """
+        with self._qcache_lock:
+            if self._cache_vecs is None or not self._cache_answers:
+                return None
+            # Rows are unit-length, so one matrix-vector product gives all cosines
+            sims = self._cache_vecs @ query_vector
+            for i, cached_params in enumerate(self._cache_params):
+                if cached_params != params:
+                    sims[i] = -1.0
+            idx = int(sims.argmax())
+            if sims[idx] < self._cfg.semantic_cache_threshold:
+                return None
+            self._semantic_move_to_end(idx)
+            return copy.deepcopy(self._cache_answers[-1])
+    
+    def _semantic_put(self, query_vector: np.ndarray, params: tuple, answer_data: Dict):
+        """Store an answer under its query embedding, evicting the least recently used entry when full."""
+        if self._cfg.semantic_cache_size <= 0 or answer_data.get("fallback"):
+            return
+        with self._qcache_lock:
+            row = query_vector.reshape(1, -1)
+            if self._cache_vecs is None or self._cache_vecs.shape[1] != row.shape[1]:
+                self._cache_vecs = row.copy()
+                self._cache_answers = [copy.deepcopy(answer_data)]
+                self._cache_params = [params]
+                return
+            self._cache_vecs = np.vstack([self._cache_vecs, row])
+            self._cache_answers.append(copy.deepcopy(answer_data))
+            self._cache_params.append(params)
+            if len(self._cache_answers) > self._cfg.semantic_cache_size:
+                self._cache_vecs = self._cache_vecs[1:]
+                self._cache_answers.pop(0)
+                self._cache_params.pop(0)
+    
+    def _semantic_move_to_end(self, idx: int):
+        """Mark a semantic cache entry as most recently used (caller holds the lock)."""
+        order = [i for i in range(len(self._cache_answers)) if i != idx] + [idx]
+        self._cache_vecs = self._cache_vecs[order]
+        self._cache_answers.append(self._cache_answers.pop(idx))
+        self._cache_params.append(self._cache_params.pop(idx))
+    
     def initialize_index(self):
         """Initialize Elasticsearch index."""
         self.indexer.create_index()
@@ -2,11 +2,93 @@
 Re-ranking Module
 Applies Reciprocal Rank Fusion (RRF) or re-ranker model to refine search results.
 """
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import gzip
+import heapq
 import logging
+import threading
+import time
+import numpy as np
+import orjson
 import requests
 from . import config
-from collections import defaultdict
+from .http_session import create_session
+from collections import OrderedDict, defaultdict
+from operator import itemgetter
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+def _score_first(item: Dict) -> float:
+    """Item score, preferring "score" over "relevance_score"."""
+    return item.get("score", item.get("relevance_score", 0.0))
+
+
+def _relevance_first(item: Dict) -> float:
+    """Item score, preferring "relevance_score" over "score"."""
+    return item.get("relevance_score", item.get("score", 0.0))
+
+
+def _nested_results(result):
+    """The "results" list nested under a "result" object, if any."""
+    nested = result.get("result")
+    return nested.get("results") if isinstance(nested, dict) else None
+
+
+# Known re-ranker response formats, tried in order: (function extracting the
+# ranked item list from a dict response, item score function)
+_RESPONSE_FORMATS = (
+    # {"ranked_documents": [{"document": "...", "score": 0.9, "index": 0}, ...], "scores": [...]}
+    (lambda result: result.get("ranked_documents"), _score_first),
+    # {"results": [{"index": 0, "relevance_score": 0.9}, ...]}
+    (lambda result: result.get("results"), _relevance_first),
+    # {"data": [{"index": 0, "score": 0.9}, ...]}
+    (lambda result: result.get("data"), _score_first),
+    # {"result": [{"index": 0, "score": 0.9}, ...]}
+    (lambda result: result.get("result"), _score_first),
+    # {"result": {"results": [{"index": 0, "relevance_score": 0.9}, ...]}}
+    (_nested_results, _relevance_first),
+)
+
+
+def _parse_rerank_response(result) -> Tuple[List[int], Dict[int, float]]:
+    """
+    Extract the ranking from a re-ranker API response.
+    
+    Args:
+        result: Decoded JSON response
+        
+    Returns:
+        Tuple of (document indices in ranked order, score per index); both
+        empty if the format is not recognized
+    """
+    if isinstance(result, list):
+        # Format: [{"index": 0, "score": 0.9}, ...]
+        items, score_of = result, _score_first
+    elif isinstance(result, dict):
+        for select, score_of in _RESPONSE_FORMATS:
+            items = select(result)
+            if isinstance(items, list):
+                break
+        else:
+            return [], {}
+    else:
+        return [], {}
+    
+    reranked_indices = []
+    reranked_scores = {}
+    for item in items:
+        if isinstance(item, dict):
+            idx = item.get("index", item.get("rank", len(reranked_indices)))
+            reranked_indices.append(idx)
+            # A null or non-numeric score only demotes its own item instead
+            # of failing the whole ranking later on
+            try:
+                reranked_scores[idx] = float(score_of(item))
+            except (TypeError, ValueError):
+                reranked_scores[idx] = 0.0
+    return reranked_indices, reranked_scores
 
 
 class Reranker:
@@ -23,6 +105,22 @@ class Reranker:
         self.rerank_url = rerank_url or config.RERANK_URL
         self.use_reranker_api = use_reranker_api
         self.top_k = config.RERANK_TOP_K
+        # Pooled keep-alive session so each query's rerank call skips the TCP/TLS handshake
+        self._session = create_session(
+            pool_maxsize=32,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504)
+        )
+        self._session.headers.update({
+            "Content-Type": "application/json",
+            "Connection": "keep-alive"
+        })
+        
+        # Short-lived LRU cache of API re-rankings: key -> (expiry time, results)
+        self._cache = OrderedDict()
+        self._cache_max = config.RERANK_CACHE_SIZE
+        self._cache_ttl = config.RERANK_CACHE_TTL
+        self._cache_lock = threading.Lock()
     
     def rerank(
         self,
@@ -46,17 +144,63 @@ class Reranker:
         if not results:
             return []
         
+        # A single candidate has nothing to be ranked against
+        if len(results) == 1:
+            return self._rerank_with_rrf(results, top_k)
+        
         if self.use_reranker_api:
-            return self._rerank_with_api(query, results, top_k)
+            key = self._cache_key(query, results, top_k)
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+            reranked = self._rerank_with_api(query, results, top_k)
+            if reranked is None:
+                # The RRF fallback is not cached, so the next call retries the API
+                return self._rerank_with_rrf(results, top_k)
+            self._cache_put(key, reranked)
+            return reranked
         else:
             return self._rerank_with_rrf(results, top_k)
     
+    @staticmethod
+    def _cache_key(query: str, results: List[Dict], top_k: int) -> Optional[tuple]:
+        """Cache key for a re-ranking, or None if any result lacks an id."""
+        ids = [result.get("id") for result in results]
+        if not all(ids):
+            return None
+        return (query, tuple(sorted(ids)), top_k)
+    
+    def _cache_get(self, key: Optional[tuple]) -> Optional[List[Dict]]:
+        """Return copies of the cached re-ranking for a key, or None if absent or expired."""
+        if key is None:
+            return None
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires, reranked = entry
+            if expires < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return [result.copy() for result in reranked]
+    
+    def _cache_put(self, key: Optional[tuple], reranked: List[Dict]):
+        """Store a re-ranking, evicting the least recently used entry when full."""
+        if key is None or self._cache_max <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic() + self._cache_ttl, [result.copy() for result in reranked])
+            self._cache.move_to_end(key)
+            if len(self._cache) > self._cache_max:
+                self._cache.popitem(last=False)
+    
     def _rerank_with_api(
         self,
         query: str,
         results: List[Dict],
         top_k: int
-    ) -> List[Dict]:
+    ) -> Optional[List[Dict]]:
         """
         Re-rank using re-ranker API.
         
@@ -66,7 +210,8 @@ class Reranker:
             top_k: Number of top results
             
         Returns:
-            Re-ranked results
+            Re-ranked results, or None if the API call failed or its response
+            could not be used
         """
         try:
             # Prepare documents for re-ranking
@@ -80,109 +225,76 @@ class Reranker:
                 "top_k": top_k
             }
             
-            headers = {
-                "Content-Type": "application/json"
-            }
+            # (connect, read) timeouts: fail fast if the service is unreachable
+            # Serialize with orjson up front instead of letting requests run stdlib json
+            body = orjson.dumps(payload)
+            headers = {}
+            if config.RERANK_GZIP and len(body) >= config.GZIP_MIN_BYTES:
+                # Candidate texts compress several-fold; level 1 keeps the CPU cost low
+                body = gzip.compress(body, compresslevel=1)
+                headers["Content-Encoding"] = "gzip"
             
-            response = requests.post(
+            response = self._session.post(
                 self.rerank_url,
-                json=payload,
+                data=body,
                 headers=headers,
-                timeout=30
+                timeout=(3.05, 30)
             )
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content)
             
-            # Debug: Log the response structure
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.debug(f"Reranker API Response keys: {list(result.keys()) if isinstance(result, dict) else 'list'}")
-            if isinstance(result, dict) and "results" in result:
-                logger.debug(f"Results type: {type(result['results'])}, first item keys: {list(result['results'][0].keys()) if result['results'] and isinstance(result['results'][0], dict) else 'N/A'}")
+            # Debug: Log the response structure (only built when DEBUG is on)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Reranker API Response keys: {list(result.keys()) if isinstance(result, dict) else 'list'}")
+                if isinstance(result, dict) and "results" in result:
+                    logger.debug(f"Results type: {type(result['results'])}, first item keys: {list(result['results'][0].keys()) if result['results'] and isinstance(result['results'][0], dict) else 'N/A'}")
             
             # Handle different response formats
-            reranked_indices = []
-            reranked_scores = {}
-            
-            if "ranked_documents" in result and isinstance(result["ranked_documents"], list):
-                # Format: {"ranked_documents": [{"document": "...", "score": 0.9, "index": 0}, ...], "scores": [...]}
-                for item in result["ranked_documents"]:
-                    if isinstance(item, dict):
-                        idx = item.get("index", item.get("rank", len(reranked_indices)))
-                        score = item.get("score", item.get("relevance_score", 0.0))
-                        reranked_indices.append(idx)
-                        reranked_scores[idx] = score
-            elif "results" in result and isinstance(result["results"], list):
-                # Format: {"results": [{"index": 0, "relevance_score": 0.9}, ...]}
-                for item in result["results"]:
-                    if isinstance(item, dict):
-                        idx = item.get("index", item.get("rank", len(reranked_indices)))
-                        score = item.get("relevance_score", item.get("score", 0.0))
-                        reranked_indices.append(idx)
-                        reranked_scores[idx] = score
-            elif "data" in result and isinstance(result["data"], list):
-                # Format: {"data": [{"index": 0, "score": 0.9}, ...]}
-                for item in result["data"]:
-                    if isinstance(item, dict):
-                        idx = item.get("index", item.get("rank", len(reranked_indices)))
-                        score = item.get("score", item.get("relevance_score", 0.0))
-                        reranked_indices.append(idx)
-                        reranked_scores[idx] = score
-            elif isinstance(result, list):
-                # Format: [{"index": 0, "score": 0.9}, ...]
-                for item in result:
-                    if isinstance(item, dict):
-                        idx = item.get("index", item.get("rank", len(reranked_indices)))
-                        score = item.get("score", item.get("relevance_score", item.get("relevance_score", 0.0)))
-                        reranked_indices.append(idx)
-                        reranked_scores[idx] = score
-            elif "result" in result:
-                # Try nested result structure
-                nested_result = result["result"]
-                if isinstance(nested_result, list):
-                    for item in nested_result:
-                        if isinstance(item, dict):
-                            idx = item.get("index", item.get("rank", len(reranked_indices)))
-                            score = item.get("score", item.get("relevance_score", 0.0))
-                            reranked_indices.append(idx)
-                            reranked_scores[idx] = score
-                elif isinstance(nested_result, dict) and "results" in nested_result:
-                    for item in nested_result["results"]:
-                        if isinstance(item, dict):
-                            idx = item.get("index", item.get("rank", len(reranked_indices)))
-                            score = item.get("relevance_score", item.get("score", 0.0))
-                            reranked_indices.append(idx)
-                            reranked_scores[idx] = score
+            reranked_indices, reranked_scores = _parse_rerank_response(result)
             
             if not reranked_indices:
                 # Fallback to RRF if API format is unexpected
                 logger.warning(f"Unexpected reranker API response format. Keys: {list(result.keys()) if isinstance(result, dict) else 'list'}")
-                logger.debug(f"Full response: {result}")
-                return self._rerank_with_rrf(results, top_k)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Full response: {result}")
+                return None
+            
+            # Re-order results based on re-ranker scores; the API may return every
+            # candidate and need not sort them, so select the top_k explicitly
+            valid = [idx for idx in reranked_indices if idx < len(results)]
+            scores = np.fromiter((reranked_scores[idx] for idx in valid), dtype=np.float64, count=len(valid))
+            if len(valid) > top_k:
+                top = np.sort(np.argpartition(-scores, top_k - 1)[:top_k])
+            else:
+                top = np.arange(len(valid))
+            # Stable sort of the (API-ordered) selection keeps the API's order on ties
+            top = top[np.argsort(-scores[top], kind="stable")]
             
-            # Re-order results based on re-ranker scores
             reranked_results = []
-            for idx in reranked_indices[:top_k]:
-                if idx < len(results):
-                    result = results[idx].copy()
-                    result["rerank_score"] = reranked_scores.get(idx, 0.0)
-                    reranked_results.append(result)
+            for pos in top:
+                idx = valid[pos]
+                result = results[idx].copy()
+                result["rerank_score"] = reranked_scores[idx]
+                reranked_results.append(result)
             
             return reranked_results
             
         except requests.exceptions.RequestException as e:
-            logging.getLogger(__name__).error("Error calling re-ranker API: %s", e)
-            logging.getLogger(__name__).info("Falling back to RRF")
-            return self._rerank_with_rrf(results, top_k)
+            logger.error("Error calling re-ranker API: %s", e)
+            logger.info("Falling back to RRF")
+            return None
         except Exception as e:
-            logging.getLogger(__name__).error("Error processing re-ranking: %s", e, exc_info=True)
-            return self._rerank_with_rrf(results, top_k)
+            logger.error("Error processing re-ranking: %s", e, exc_info=True)
+            return None
     
     def _rerank_with_rrf(self, results: List[Dict], top_k: int) -> List[Dict]:
         """
         Re-rank using Reciprocal Rank Fusion (RRF).
         
+        Only result ids and order are used, so id-only search results
+        (HybridRetriever.search with return_text=False) are enough.
+        
         Args:
             results: List of results to re-rank
             top_k: Number of top results
@@ -193,30 +305,25 @@ class Reranker:
         # RRF formula: score = sum(1 / (k + rank))
         k = 60  # RRF constant
         
-        # Calculate RRF scores
-        rrf_scores = {}
+        # Calculate RRF scores, resolving each result's id once
+        rrf_scores = defaultdict(float)
+        doc_ids = []
         for rank, result in enumerate(results, 1):
-            doc_id = result.get("id", str(rank))
-            rrf_score = 1.0 / (k + rank)
-            
-            if doc_id in rrf_scores:
-                rrf_scores[doc_id] += rrf_score
-            else:
-                rrf_scores[doc_id] = rrf_score
+            doc_id = result.get("id") or str(rank)
+            doc_ids.append(doc_id)
+            rrf_scores[doc_id] += 1.0 / (k + rank)
         
-        # Sort by RRF score
-        sorted_results = sorted(
-            results,
-            key=lambda x: rrf_scores.get(x.get("id", ""), 0.0),
-            reverse=True
-        )
+        # Look up each score once, then select the top_k without sorting the whole list
+        scored = [(rrf_scores[doc_id], result) for doc_id, result in zip(doc_ids, results)]
+        top_scored = heapq.nlargest(top_k, scored, key=itemgetter(0))
         
         # Add RRF scores to results
-        for result in sorted_results:
-            doc_id = result.get("id", "")
-            result["rerank_score"] = rrf_scores.get(doc_id, 0.0)
+        top_results = []
+        for score, result in top_scored:
+            result["rerank_score"] = score
+            top_results.append(result)
         
-        return sorted_results[:top_k]
+        return top_results
     
     def rerank_multiple_queries(
         self,
@@ -227,9 +334,14 @@ class Reranker:
         """
         Re-rank results from multiple queries using RRF.
         
+        Each document scores sum(1 / (60 + rank)) over the result lists it
+        appears in, with rank its 1-based position in that list. Documents
+        returned by several queries are merged into one result.
+        
         Args:
             queries: List of query texts
-            query_results: List of result lists, one per query
+            query_results: List of result lists, one per query (as returned by
+                HybridRetriever.msearch)
             top_k: Number of top results
             
         Returns:
@@ -243,11 +355,36 @@ class Reranker:
         if len(queries) != len(query_results):
             raise ValueError("Number of queries must match number of result lists")
         
-        # Combine results from all queries
-        all_results = []
+        # Flatten (doc_id, rank) pairs across all result lists
+        docs = []
+        ids = []
+        ranks = []
         for results in query_results:
-            all_results.extend(results)
+            for rank, result in enumerate(results, 1):
+                # Results without an id are never merged with each other
+                ids.append(result.get("id") or f"\0{len(ids)}")
+                ranks.append(rank)
+                docs.append(result)
+        
+        if not docs:
+            return []
+        
+        # Sum RRF scores per unique id in one vectorized pass
+        k = 60  # RRF constant
+        uniq, first, inverse = np.unique(np.array(ids), return_index=True, return_inverse=True)
+        scores = np.zeros(len(uniq))
+        np.add.at(scores, inverse, 1.0 / (k + np.array(ranks, dtype=np.float64)))
+        
+        # Top-k by score; ties keep the order documents were first seen
+        n = min(top_k, len(uniq))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.lexsort((first[top], -scores[top]))]
+        
+        reranked_results = []
+        for i in top:
+            result = docs[first[i]].copy()
+            result["rerank_score"] = float(scores[i])
+            reranked_results.append(result)
         
-        # Use RRF to re-rank combined results
-        return self._rerank_with_rrf(all_results, top_k)
+        return reranked_results
 
@@ -1,10 +1,14 @@
 """Retrieval Module - Hybrid BM25 + Vector Search."""
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Union
 import logging
-from elasticsearch import Elasticsearch
+from elasticsearch import AuthorizationException, BadRequestError, Elasticsearch
 from . import config
+from .es_indexer import get_client, quantize_int8
 import numpy as np
 
+# Set up logger
+logger = logging.getLogger(__name__)
+
 
 class HybridRetriever:
     """Perform hybrid search combining BM25 and vector search."""
@@ -19,90 +23,157 @@ class HybridRetriever:
         if es_client:
             self.client = es_client
         else:
-            self.client = self._create_client()
+            self.client = get_client()
         self.index_name = config.ELASTICSEARCH_INDEX_NAME
         self.bm25_weight = config.BM25_WEIGHT
         self.vector_weight = config.VECTOR_WEIGHT
+        self.fusion = config.RETRIEVAL_FUSION
+        # Cleared if the cluster rejects knn search; script_score is used instead
+        self._knn_supported = True
+        # Cleared if the cluster rejects RRF retrievers; weighted fusion is used instead
+        self._rrf_supported = True
     
-    def _create_client(self) -> Elasticsearch:
-        """Create Elasticsearch client using available credentials."""
-        if config.ELASTICSEARCH_API_KEY:
-            es_client = Elasticsearch(
-                [config.ELASTICSEARCH_HOST],
-                api_key=config.ELASTICSEARCH_API_KEY,
-                verify_certs=config.ELASTICSEARCH_VERIFY_CERTS,
-                ssl_show_warn=False
-            )
-        elif config.ELASTICSEARCH_PASSWORD:
-            es_client = Elasticsearch(
-                [config.ELASTICSEARCH_HOST],
-                basic_auth=(config.ELASTICSEARCH_USER, config.ELASTICSEARCH_PASSWORD),
-                verify_certs=config.ELASTICSEARCH_VERIFY_CERTS,
-                ssl_show_warn=False
-            )
-        else:
-            es_client = Elasticsearch(
-                [config.ELASTICSEARCH_HOST],
-                verify_certs=config.ELASTICSEARCH_VERIFY_CERTS,
-                ssl_show_warn=False
-            )
-        return es_client
+    @staticmethod
+    def _query_vector(query_embedding: Union[List[float], np.ndarray]) -> np.ndarray:
+        """
+        Match the query vector to the stored element type (int8 when quantized).
+        
+        Float vectors are sent as float32 arrays, which the client serializes
+        natively with float32 precision instead of 17-digit float64 literals.
+        """
+        if config.EMBEDDING_QUANTIZE_INT8:
+            return quantize_int8(query_embedding)
+        return np.asarray(query_embedding, dtype=np.float32)
     
-    def search(
+    @staticmethod
+    def _knn_clause(query_vector, top_k: int, filters: Dict = None, boost: float = None) -> Dict:
+        """Build an approximate (HNSW) kNN clause over the embedding field."""
+        knn = {
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": top_k,
+            "num_candidates": max(100, 4 * top_k)
+        }
+        if boost is not None:
+            knn["boost"] = boost
+        if filters:
+            knn["filter"] = filters
+        return knn
+    
+    @staticmethod
+    def _script_score_clause(query_vector, boost: float = 1.0) -> Dict:
+        """Build a brute-force cosine script_score clause (cos + 1) over every document."""
+        return {
+            "script_score": {
+                "query": {"match_all": {}},
+                "script": {
+                    "source": """
+                        double similarity = cosineSimilarity(params.query_vector, 'embedding');
+                        if (Double.isNaN(similarity) || Double.isInfinite(similarity)) {
+                            return 0.0;
+                        }
+                        return similarity + 1.0;
+                    """,
+                    "params": {
+                        "query_vector": query_vector
+                    }
+                },
+                "boost": boost
+            }
+        }
+    
+    def _run_search(self, search_body: Dict) -> Dict:
+        """Execute a search body against the index."""
+        try:
+            # Use keyword parameters for newer Elasticsearch client versions
+            return self.client.search(index=self.index_name, **search_body)
+        except TypeError:
+            # Fallback to body parameter for older versions
+            return self.client.search(index=self.index_name, body=search_body)
+    
+    def _run_vector_search(self, knn_body: Dict, script_body: Dict) -> Dict:
+        """Run a knn search, switching to the script_score body if the cluster lacks knn."""
+        if self._knn_supported:
+            try:
+                return self._run_search(knn_body)
+            except BadRequestError as e:
+                logger.warning(
+                    "knn search rejected (%s); falling back to script_score vector search", e
+                )
+                self._knn_supported = False
+        return self._run_search(script_body)
+    
+    @staticmethod
+    def _to_results(response: Dict) -> List[Dict]:
+        """
+        Convert search hits to result dictionaries.
+        
+        Hits from id-only searches (no _source) yield just chunk_id, score and id.
+        """
+        results = []
+        for hit in response["hits"]["hits"]:
+            if "_source" not in hit:
+                results.append({
+                    "chunk_id": hit["fields"]["chunk_id"][0],
+                    "score": hit["_score"],
+                    "id": hit["_id"]
+                })
+                continue
+            results.append({
+                "text": hit["_source"]["text"],
+                "chunk_id": hit["_source"]["chunk_id"],
+                "metadata": hit["_source"].get("metadata", {}),
+                "score": hit["_score"],
+                "id": hit["_id"]
+            })
+        return results
+    
+    def _hybrid_bodies(
         self,
         query: str,
-        query_embedding: List[float],
-        top_k: int = None,
-        filters: Dict = None
-    ) -> List[Dict]:
+        query_embedding: Union[List[float], np.ndarray],
+        top_k: int,
+        filters: Dict = None,
+        return_text: bool = True
+    ) -> Dict[str, Dict]:
         """
-        Perform hybrid search combining BM25 and vector search.
+        Build the hybrid search bodies for each fusion/vector-search mode.
+        
+        With return_text False the bodies skip _source and fetch only
+        chunk_id from doc values.
         
-        Args:
-            query: Text query for BM25 search
-            query_embedding: Query embedding for vector search
-            top_k: Number of results to return
-            filters: Optional filters to apply
-            
         Returns:
-            List of search results with scores
+            Bodies keyed by mode: "rrf", "knn" and "script"
         """
-        top_k = top_k or config.RETRIEVAL_TOP_K
+        query_vector = self._query_vector(query_embedding)
         
-        # Build the search query
-        search_body = {
+        # BM25 keyword search
+        bm25_query = {
+            "match": {
+                "text": {
+                    "query": query,
+                    "boost": self.bm25_weight
+                }
+            }
+        }
+        
+        # knn scores unit vectors as (1 + cos) / 2; doubling the boost keeps the
+        # same BM25/vector balance as the script_score form (cos + 1)
+        knn_body = {
+            "size": top_k,
+            "query": {"bool": {"must": [bm25_query], "filter": filters}} if filters else bm25_query,
+            "knn": self._knn_clause(query_vector, top_k, filters, boost=2 * self.vector_weight),
+            "_source": ["text", "chunk_id", "metadata"],
+            "min_score": 0.1  # Minimum score threshold
+        }
+        
+        script_body = {
             "size": top_k,
             "query": {
                 "bool": {
                     "should": [
-                        # BM25 keyword search
-                        {
-                            "match": {
-                                "text": {
-                                    "query": query,
-                                    "boost": self.bm25_weight
-                                }
-                            }
-                        },
-                        # Vector similarity search
-                        {
-                            "script_score": {
-                                "query": {"match_all": {}},
-                                "script": {
-                                    "source": """
-                                        double similarity = cosineSimilarity(params.query_vector, 'embedding');
-                                        if (Double.isNaN(similarity) || Double.isInfinite(similarity)) {
-                                            return 0.0;
-                                        }
-                                        return similarity + 1.0;
-                                    """,
-                                    "params": {
-                                        "query_vector": query_embedding
-                                    }
-                                },
-                                "boost": self.vector_weight
-                            }
-                        }
+                        bm25_query,
+                        self._script_score_clause(query_vector, boost=self.vector_weight)
                     ]
                 }
             },
@@ -112,37 +183,149 @@ class HybridRetriever:
         
         # Add filters if provided
         if filters:
-            search_body["query"]["bool"]["filter"] = filters
+            script_body["query"]["bool"]["filter"] = filters
         
-        try:
-            # Use query parameter for newer Elasticsearch client versions
-            try:
-                response = self.client.search(
-                    index=self.index_name,
-                    query=search_body["query"],
-                    size=search_body.get("size", 10),
-                    _source=search_body.get("_source", True),
-                    min_score=search_body.get("min_score", 0)
-                )
-            except TypeError:
-                # Fallback to body parameter for older versions
-                response = self.client.search(index=self.index_name, body=search_body)
-            
-            results = []
-            for hit in response["hits"]["hits"]:
-                results.append({
-                    "text": hit["_source"]["text"],
-                    "chunk_id": hit["_source"]["chunk_id"],
-                    "metadata": hit["_source"].get("metadata", {}),
-                    "score": hit["_score"],
-                    "id": hit["_id"]
-                })
-            
-            return results
+        bodies = {
+            "rrf": self._rrf_body(bm25_query, query_vector, top_k, filters),
+            "knn": knn_body,
+            "script": script_body
+        }
+        if not return_text:
+            for body in bodies.values():
+                body["_source"] = False
+                body["docvalue_fields"] = ["chunk_id"]
+        return bodies
+    
+    def _preferred_mode(self) -> str:
+        """Return the hybrid search mode to try first on this cluster."""
+        if self.fusion == "rrf" and self._rrf_supported:
+            return "rrf"
+        return "knn" if self._knn_supported else "script"
+    
+    def search(
+        self,
+        query: str,
+        query_embedding: Union[List[float], np.ndarray],
+        top_k: int = None,
+        filters: Dict = None,
+        return_text: bool = True
+    ) -> List[Dict]:
+        """
+        Perform hybrid search combining BM25 and vector search.
+        
+        The vector side is an approximate kNN (HNSW) search. With
+        config.RETRIEVAL_FUSION "rrf" Elasticsearch fuses the BM25 and kNN
+        rankings natively; otherwise the kNN scores are added to the weighted
+        BM25 scores. Clusters without RRF fall back to weighted fusion, and
+        clusters without knn to a brute-force script_score query.
+        
+        Args:
+            query: Text query for BM25 search
+            query_embedding: Query embedding for vector search (list or ndarray)
+            top_k: Number of results to return
+            filters: Optional filters to apply
+            return_text: If False, skip fetching text and metadata; results
+                carry only chunk_id, score and id (enough for RRF fusion)
             
+        Returns:
+            List of search results with scores
+        """
+        top_k = top_k or config.RETRIEVAL_TOP_K
+        bodies = self._hybrid_bodies(query, query_embedding, top_k, filters, return_text)
+        
+        try:
+            if self._preferred_mode() == "rrf":
+                try:
+                    return self._to_results(self._run_search(bodies["rrf"]))
+                except (BadRequestError, AuthorizationException) as e:
+                    logger.warning(
+                        "RRF retriever rejected (%s); falling back to weighted hybrid search", e
+                    )
+                    self._rrf_supported = False
+            return self._to_results(self._run_vector_search(bodies["knn"], bodies["script"]))
         except Exception as e:
-            logging.getLogger(__name__).error("Error performing search: %s", e, exc_info=True)
+            logger.error("Error performing search: %s", e, exc_info=True)
+            return []
+    
+    def msearch(
+        self,
+        queries: List[Tuple[str, Union[List[float], np.ndarray]]],
+        top_k: int = None,
+        filters: Dict = None,
+        return_text: bool = True
+    ) -> List[List[Dict]]:
+        """
+        Run several hybrid searches in one _msearch round trip.
+        
+        Each sub-search is the same request search() would send. Sub-searches
+        the cluster rejects are retried individually through search(), which
+        also handles the RRF and knn fallbacks.
+        
+        Args:
+            queries: (query text, query embedding) pairs
+            top_k: Number of results to return per query
+            filters: Optional filters applied to every query
+            return_text: If False, results carry only chunk_id, score and id
+            
+        Returns:
+            One result list per query, in input order
+        """
+        top_k = top_k or config.RETRIEVAL_TOP_K
+        if not queries:
             return []
+        
+        mode = self._preferred_mode()
+        searches = []
+        for query, query_embedding in queries:
+            searches.append({"index": self.index_name})
+            searches.append(self._hybrid_bodies(query, query_embedding, top_k, filters, return_text)[mode])
+        
+        try:
+            responses = self.client.msearch(searches=searches)["responses"]
+        except Exception as e:
+            logger.error("Error performing multi-search: %s", e, exc_info=True)
+            responses = [None] * len(queries)
+        
+        if len(responses) != len(queries):
+            logger.warning(
+                "Multi-search returned %d responses for %d queries; retrying the missing ones alone",
+                len(responses), len(queries)
+            )
+            responses = (list(responses) + [None] * len(queries))[:len(queries)]
+        
+        all_results = []
+        for (query, query_embedding), response in zip(queries, responses):
+            if response is None or "error" in response:
+                if response is not None:
+                    logger.warning(
+                        "Multi-search sub-query failed (%s); retrying it alone", response["error"]
+                    )
+                all_results.append(self.search(query, query_embedding, top_k, filters, return_text))
+            else:
+                all_results.append(self._to_results(response))
+        return all_results
+    
+    def _rrf_body(self, bm25_query: Dict, query_vector, top_k: int, filters: Dict = None) -> Dict:
+        """Build a search body fusing BM25 and kNN rankings with Elasticsearch's RRF retriever."""
+        window = max(config.RRF_WINDOW_SIZE, top_k)
+        standard = {"query": bm25_query}
+        if filters:
+            standard["filter"] = filters
+        # Ranks alone drive the fusion, so no boosts here
+        return {
+            "size": top_k,
+            "retriever": {
+                "rrf": {
+                    "retrievers": [
+                        {"standard": standard},
+                        {"knn": self._knn_clause(query_vector, window, filters)}
+                    ],
+                    "rank_constant": config.RRF_RANK_CONSTANT,
+                    "rank_window_size": window
+                }
+            },
+            "_source": ["text", "chunk_id", "metadata"]
+        }
     
     def search_bm25_only(self, query: str, top_k: int = None) -> List[Dict]:
         """
@@ -168,95 +351,47 @@ class HybridRetriever:
         }
         
         try:
-            # Use query parameter for newer Elasticsearch client versions
-            try:
-                response = self.client.search(
-                    index=self.index_name,
-                    query=search_body["query"],
-                    size=search_body.get("size", 10),
-                    _source=search_body.get("_source", True)
-                )
-            except TypeError:
-                # Fallback to body parameter for older versions
-                response = self.client.search(index=self.index_name, body=search_body)
-            
-            results = []
-            for hit in response["hits"]["hits"]:
-                results.append({
-                    "text": hit["_source"]["text"],
-                    "chunk_id": hit["_source"]["chunk_id"],
-                    "metadata": hit["_source"].get("metadata", {}),
-                    "score": hit["_score"],
-                    "id": hit["_id"]
-                })
-            
-            return results
-            
+            return self._to_results(self._run_search(search_body))
         except Exception as e:
-            logging.getLogger(__name__).error("Error performing BM25 search: %s", e, exc_info=True)
+            logger.error("Error performing BM25 search: %s", e, exc_info=True)
             return []
     
     def search_vector_only(
         self,
-        query_embedding: List[float],
+        query_embedding: Union[List[float], np.ndarray],
         top_k: int = None
     ) -> List[Dict]:
         """
         Perform vector similarity search only.
         
+        Uses approximate kNN (HNSW), or a brute-force script_score query on
+        clusters without knn support.
+        
         Args:
-            query_embedding: Query embedding vector
+            query_embedding: Query embedding vector (list or ndarray)
             top_k: Number of results to return
             
         Returns:
             List of search results
         """
         top_k = top_k or config.RETRIEVAL_TOP_K
+        query_vector = self._query_vector(query_embedding)
         
-        search_body = {
+        knn_body = {
             "size": top_k,
-            "query": {
-                "script_score": {
-                    "query": {"match_all": {}},
-                    "script": {
-                        "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                        "params": {
-                            "query_vector": query_embedding
-                        }
-                    }
-                }
-            },
+            "knn": self._knn_clause(query_vector, top_k),
+            "_source": ["text", "chunk_id", "metadata"]
+        }
+        
+        script_body = {
+            "size": top_k,
+            "query": self._script_score_clause(query_vector),
             "_source": ["text", "chunk_id", "metadata"],
             "min_score": 0.1
         }
         
         try:
-            # Use query parameter for newer Elasticsearch client versions
-            try:
-                response = self.client.search(
-                    index=self.index_name,
-                    query=search_body["query"],
-                    size=search_body.get("size", 10),
-                    _source=search_body.get("_source", True),
-                    min_score=search_body.get("min_score", 0)
-                )
-            except TypeError:
-                # Fallback to body parameter for older versions
-                response = self.client.search(index=self.index_name, body=search_body)
-            
-            results = []
-            for hit in response["hits"]["hits"]:
-                results.append({
-                    "text": hit["_source"]["text"],
-                    "chunk_id": hit["_source"]["chunk_id"],
-                    "metadata": hit["_source"].get("metadata", {}),
-                    "score": hit["_score"],
-                    "id": hit["_id"]
-                })
-            
-            return results
-            
+            return self._to_results(self._run_vector_search(knn_body, script_body))
         except Exception as e:
-            logging.getLogger(__name__).error("Error performing vector search: %s", e, exc_info=True)
+            logger.error("Error performing vector search: %s", e, exc_info=True)
             return []
-
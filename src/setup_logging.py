@@ -2,14 +2,40 @@
 Logging Configuration
 Sets up logging for the RAG system.
 """
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 from datetime import datetime
 
+# Log file rotation: size at which a file is rolled over, and rolled files kept
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
+
+# Background thread writing queued records to the file and console handlers
+_listener = None
+
+
+def _stop_listener():
+    """Flush queued records and stop the background log writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
 def setup_logging(log_level=logging.INFO, log_file=None):
     """
     Set up logging configuration.
     
+    Log calls only enqueue the record; a background thread formats it and
+    writes it to the log file and console, so request threads never block
+    on log I/O. The log file rotates at LOG_FILE_MAX_BYTES.
+    
     Args:
         log_level: Logging level (default: INFO)
         log_file: Optional log file path. If None, creates logs/rag_system.log
@@ -36,20 +62,33 @@ def setup_logging(log_level=logging.INFO, log_file=None):
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
     
-    # Remove existing handlers
+    # Remove existing handlers, flushing any previous background writer
+    _stop_listener()
     root_logger.handlers = []
     
     # File handler (detailed)
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=LOG_FILE_MAX_BYTES,
+        backupCount=LOG_FILE_BACKUP_COUNT,
+        encoding='utf-8'
+    )
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(detailed_formatter)
-    root_logger.addHandler(file_handler)
     
     # Console handler (simple)
     console_handler = logging.StreamHandler()
     console_handler.setLevel(log_level)
     console_handler.setFormatter(simple_formatter)
-    root_logger.addHandler(console_handler)
+    
+    # Root logger only enqueues; the listener thread drains to both handlers
+    log_queue = queue.Queue(-1)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    global _listener
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
     
     logging.info(f"Logging configured: Level={logging.getLevelName(log_level)}, File={log_file}")
     
@@ -0,0 +1,33 @@
+"""
+Tests for ESIndexer.index_documents input handling.
+"""
+import unittest
+from unittest import mock
+
+from src.es_indexer import ESIndexer
+
+
+class IndexDocumentsTest(unittest.TestCase):
+    """index_documents edge cases that never reach Elasticsearch."""
+
+    def setUp(self):
+        patcher = mock.patch("src.es_indexer.get_client")
+        self.addCleanup(patcher.stop)
+        self.client = patcher.start().return_value
+        self.client.indices.exists.return_value = True
+        self.indexer = ESIndexer()
+
+    def test_empty_batch_succeeds(self):
+        with mock.patch("src.es_indexer.parallel_bulk") as bulk:
+            self.assertTrue(self.indexer.index_documents([], []))
+        bulk.assert_not_called()
+
+    def test_all_zero_vectors_fail(self):
+        chunks = [{"text": "a", "chunk_id": 0}, {"text": "b", "chunk_id": 1}]
+        with mock.patch("src.es_indexer.parallel_bulk") as bulk:
+            self.assertFalse(self.indexer.index_documents(chunks, [[0.0, 0.0, 0.0]] * 2))
+        bulk.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()